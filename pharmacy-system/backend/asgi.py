@@ -0,0 +1,425 @@
+# 异步服务模式
+#
+# 收银高频接口（GET/POST /api/sales）在 asyncpg 连接池上原生异步执行，等待数据库时不占用线程；
+# 变更事件推送 GET /api/events 的长连接也在事件循环中处理；
+# 其余接口原样交给 Flask 应用（通过 a2wsgi 在线程池中执行）。JSON 格式、错误消息和 JWT 校验
+# 与同步模式一致，令牌可以在两种模式之间通用。
+#
+# 依赖见 requirements-async.txt，启动：
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000
+import asyncio
+import contextlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import asyncpg
+import jwt as pyjwt
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as pharmacy
+from db_pool import DB_CONFIG
+from events import NOTIFY_SQL, notify_params
+from idempotency import CLAIM_SQL, STORED_SQL, SAVE_SQL, IdempotencyMismatch, request_key
+from lots import ALLOCATE_SQL, LotShortage, allocation_params, shortages
+from pagination import InvalidParameter, encode_cursor
+from replicas import REPLICA_CONNECT_TIMEOUT
+from response_cache import bump_sql
+from sales import (SALE_MAX_RETRIES, STOCK_UPDATE_SQL, INSERT_SALE_SQL, ROLLUP_SQL, InvalidSale, sale_metrics,
+                   parse_sale, stock_update_params, observe_stock_update, retry_delay, sale_response, sale_event,
+                   after_commit)
+
+ASYNC_DB_POOL_MIN_SIZE = int(os.environ.get('ASYNC_DB_POOL_MIN_SIZE', 1))
+ASYNC_DB_POOL_MAX_SIZE = int(os.environ.get('ASYNC_DB_POOL_MAX_SIZE', 20))
+ASYNC_DB_POOL_TIMEOUT = float(os.environ.get('ASYNC_DB_POOL_TIMEOUT', 5))
+# 执行 Flask 接口的线程数
+ASYNC_WSGI_THREADS = int(os.environ.get('ASYNC_WSGI_THREADS', 10))
+
+SALE_RETRYABLE_ERRORS = (asyncpg.exceptions.SerializationError, asyncpg.exceptions.DeadlockDetectedError)
+
+flask_app = pharmacy.create_app({'CORS_ENABLED': False})
+flask_wsgi = WSGIMiddleware(flask_app, workers=ASYNC_WSGI_THREADS)
+
+
+class AuthError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# 与 Flask jsonify 的输出保持一致
+def json_response(data, status=200, headers=None):
+    body = json.dumps(data, ensure_ascii=flask_app.config['JSON_AS_ASCII'],
+                      sort_keys=flask_app.config['JSON_SORT_KEYS'], separators=(',', ':')) + '\n'
+    return Response(body, status_code=status, headers=headers, media_type='application/json')
+
+
+# psycopg2 的 %s 占位符转换为 asyncpg 的 $1, $2 ...
+def numbered(sql):
+    parts = sql.split('%s')
+    return ''.join(part + (f'${i}' if i < len(parts) else '') for i, part in enumerate(parts, start=1))
+
+
+class MissingToken(AuthError):
+    def __init__(self, message):
+        super().__init__(401, message)
+
+
+def token_from_header(request):
+    header = request.headers.get('Authorization', '').strip().strip(',')
+    if not header:
+        raise MissingToken('Missing Authorization Header')
+    values = [v for v in re.split(r',\s*', header) if v.split()[0] == 'Bearer']
+    if len(values) != 1:
+        raise MissingToken("Missing 'Bearer' type in 'Authorization' header. Expected 'Authorization: Bearer <JWT>'")
+    parts = values[0].split()
+    if len(parts) != 2:
+        raise AuthError(422, "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'")
+    return parts[1]
+
+
+def token_from_query_string(request):
+    name = flask_app.config['JWT_QUERY_STRING_NAME']
+    value = request.query_params.get(name)
+    if not value:
+        raise MissingToken(f"Missing '{name}' query paramater")
+    return value
+
+
+# 按 flask_jwt_extended 的规则校验访问令牌，错误响应也与之相同（{"msg": ...}）。
+# query_string=True 时与 @jwt_required(locations=['headers', 'query_string']) 相同，两处都可以带令牌
+def authenticate(request, query_string=False):
+    sources = [token_from_header] + ([token_from_query_string] if query_string else [])
+    errors = []
+    for source in sources:
+        try:
+            token = source(request)
+            break
+        except MissingToken as e:
+            errors.append(str(e))
+    else:
+        if len(errors) == 1:
+            raise MissingToken(errors[0])
+        raise MissingToken(f"Missing JWT in headers or query_string ({'; '.join(errors)})")
+    config = flask_app.config
+    try:
+        claims = pyjwt.decode(token, config['JWT_SECRET_KEY'], algorithms=[config['JWT_ALGORITHM']],
+                              leeway=config['JWT_DECODE_LEEWAY'])
+    except pyjwt.ExpiredSignatureError:
+        raise AuthError(401, 'Token has expired')
+    except pyjwt.InvalidTokenError as e:
+        raise AuthError(422, str(e))
+    if claims.get('type') != 'access':
+        raise AuthError(422, 'Only non-refresh tokens are allowed')
+    if flask_app.extensions['pharmacy']['token_blocklist'].is_revoked(claims):
+        raise AuthError(401, 'Token has been revoked')
+    return claims
+
+
+# 与同步模式的 borrow_connection 相同的读写分离：由 ReplicaRouter 选择健康且已回放到该用户写操作位置
+# （本进程记录的写操作和 X-Min-LSN 请求头）的副本，没有可用的副本时使用主库。
+# 每个副本一个 asyncpg 连接池，在 lifespan 中创建，第一次借用时才建立连接
+@contextlib.asynccontextmanager
+async def read_connection(request, claims):
+    router = flask_app.extensions['pharmacy']['replica_router']
+    if router.enabled:
+        min_lsn = pharmacy.min_read_lsn(router, claims[flask_app.config['JWT_IDENTITY_CLAIM']],
+                                        request.headers.get('X-Min-LSN'))
+        candidates = router.candidates(min_lsn)
+        for replica in candidates:
+            replica_pool = request.app.state.replica_pools[replica.name]
+            try:
+                conn = await replica_pool.acquire(timeout=ASYNC_DB_POOL_TIMEOUT)
+            except asyncio.TimeoutError:
+                router.record_busy()
+                continue
+            except (OSError, asyncpg.PostgresError) as e:
+                router.mark_failed(replica, e)
+                continue
+            router.record_routed(replica)
+            try:
+                yield conn
+            finally:
+                await replica_pool.release(conn)
+            return
+        if candidates:
+            router.record_primary_read()
+    async with request.app.state.db_pool.acquire(timeout=ASYNC_DB_POOL_TIMEOUT) as conn:
+        yield conn
+
+
+async def list_sales(request):
+    claims = authenticate(request)
+    sql, params, paginate, limit = pharmacy.build_sales_query(request.query_params)
+    try:
+        async with read_connection(request, claims) as conn:
+            sales = await conn.fetch(numbered(sql), *params)
+    except asyncio.TimeoutError:
+        raise
+    except Exception as e:
+        return json_response({'message': f'获取销售记录失败: {str(e)}'}, 500)
+    headers = {}
+    if paginate and len(sales) > limit:
+        sales = sales[:limit]
+        headers['X-Next-Cursor'] = encode_cursor(sales[-1][5], sales[-1][0])
+    # 与 Flask 的 list_response 相同的编码和压缩
+    encoder = flask_app.extensions['pharmacy']['response_encoder']
+    body = encoder.encode_rows(pharmacy.SALE_FIELDS, sales, request.query_params.get('format') == 'compact')
+    body, encoding_headers = encoder.compress(body, encoder.negotiate(request.headers.get('Accept-Encoding')))
+    headers.update(encoding_headers)
+    return Response(body, headers=headers, media_type='application/json')
+
+
+ALLOCATE_SQL_NUMBERED = numbered(ALLOCATE_SQL)
+CLAIM_SQL_NUMBERED = numbered(CLAIM_SQL)
+STORED_SQL_NUMBERED = numbered(STORED_SQL)
+SAVE_SQL_NUMBERED = numbered(SAVE_SQL)
+STOCK_UPDATE_SQL_NUMBERED = numbered(STOCK_UPDATE_SQL)
+INSERT_SALE_SQL_NUMBERED = numbered(INSERT_SALE_SQL)
+ROLLUP_SQL_NUMBERED = numbered(ROLLUP_SQL)
+NOTIFY_SQL_NUMBERED = numbered(NOTIFY_SQL)
+
+
+def replay_response(stored):
+    status, body = stored
+    return Response(body, status_code=status, media_type='application/json', headers={'Idempotent-Replayed': 'true'})
+
+
+# 与同步模式的 create_sale 执行相同的语句和提交后步骤（见 sales.py），只是在 asyncpg 连接上执行
+async def create_sale(request):
+    claims = authenticate(request)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    try:
+        medicine_id, quantity = parse_sale(data)
+    except InvalidSale as e:
+        return json_response({'message': str(e)}, 400)
+    salesperson_id = int(claims[flask_app.config['JWT_IDENTITY_CLAIM']])
+    services = flask_app.extensions['pharmacy']
+    # 幂等键与同步模式共用 idempotency_keys 表和进程内缓存
+    store = services['idempotency']
+    idempotency_key = request_key(request.headers.get('Idempotency-Key'), salesperson_id, request.method,
+                                  request.url.path, await request.body())
+    if idempotency_key:
+        store.ensure_started(services['pool'])
+        try:
+            stored = store.lookup(*idempotency_key)
+        except IdempotencyMismatch as e:
+            return json_response({'message': str(e)}, 422)
+        if stored:
+            return replay_response(stored)
+
+    async with request.app.state.db_pool.acquire(timeout=ASYNC_DB_POOL_TIMEOUT) as conn:
+        for attempt in range(SALE_MAX_RETRIES + 1):
+            sale_metrics.inc('attempts')
+            transaction = conn.transaction()
+            await transaction.start()
+            try:
+                if idempotency_key:
+                    claimed = await conn.fetchval(CLAIM_SQL_NUMBERED, *idempotency_key, store.ttl)
+                    if not claimed:
+                        row = await conn.fetchrow(STORED_SQL_NUMBERED, idempotency_key[0])
+                        await transaction.rollback()
+                        return replay_response(store.replay(*idempotency_key, row))
+                started = time.monotonic()
+                medicine = await conn.fetchrow(STOCK_UPDATE_SQL_NUMBERED, *stock_update_params(medicine_id, quantity))
+                observe_stock_update(time.monotonic() - started)
+                if medicine is None:
+                    await transaction.rollback()
+                    sale_metrics.inc('out_of_stock')
+                    return json_response({'message': '库存不足'}, 400)
+                total_price = medicine['price'] * quantity
+                now = datetime.now()
+                sale_id = await conn.fetchval(INSERT_SALE_SQL_NUMBERED, medicine_id, salesperson_id, quantity,
+                                              total_price, now)
+                sales = [(sale_id, medicine_id, quantity)]
+                allocations = await conn.fetch(ALLOCATE_SQL_NUMBERED, *allocation_params(sales))
+                short = shortages(sales, allocations)
+                if short:
+                    await transaction.rollback()
+                    sale_metrics.inc('out_of_stock')
+                    return json_response({'message': str(LotShortage(short))}, 400)
+                await conn.execute(ROLLUP_SQL_NUMBERED, now.date(), medicine_id, salesperson_id, quantity, total_price)
+                event = sale_event(sale_id, medicine_id, medicine['name'], quantity, total_price, now,
+                                   salesperson_id, medicine['stock'])
+                await conn.execute(NOTIFY_SQL_NUMBERED, *notify_params([('sale_created', event)]))
+                body = json_response(sale_response(sale_id)).body
+                if idempotency_key:
+                    await conn.execute(SAVE_SQL_NUMBERED, 200, body, idempotency_key[0])
+                await transaction.commit()
+            except IdempotencyMismatch as e:
+                return json_response({'message': str(e)}, 422)
+            except SALE_RETRYABLE_ERRORS:
+                await transaction.rollback()
+                sale_metrics.inc('conflicts')
+                if attempt == SALE_MAX_RETRIES:
+                    break
+                sale_metrics.inc('retries')
+                await asyncio.sleep(retry_delay(attempt))
+                continue
+            except Exception as e:
+                await transaction.rollback()
+                sale_metrics.inc('failures')
+                flask_app.logger.exception('POST /api/sales 处理失败')
+                return json_response({'message': f'销售失败: {str(e)}'}, 500)
+            after_commit(services, idempotency_key, body, medicine_id, quantity, medicine['stock'])
+            # 配置了只读副本时同时取回主库的 WAL 位置，该用户随后的读请求在副本同步之前使用主库
+            router = services['replica_router']
+            headers = {}
+            try:
+                row = await conn.fetchrow(bump_sql(['catalogue_version_seq'], router.enabled))
+                if router.enabled:
+                    router.record_write(str(salesperson_id), row[-1])
+                    headers['X-Write-LSN'] = row[-1]
+            except Exception:
+                flask_app.logger.exception('递增目录版本号失败')
+            return Response(body, headers=headers, media_type='application/json')
+    sale_metrics.inc('failures')
+    return json_response({'message': '系统繁忙，请稍后重试'}, 503)
+
+
+# /api/sales 的 GET/POST 原生异步处理；format=ndjson 的流式导出仍由 Flask 处理
+class SalesCollection:
+    rule = '/api/sales'
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        # Starlette 为 GET 路由同时注册 HEAD，HEAD 按 GET 处理
+        if request.method in ('GET', 'HEAD') and request.query_params.get('format') == 'ndjson':
+            await flask_wsgi(scope, receive, send)
+            return
+        handler = create_sale if request.method == 'POST' else list_sales
+        started = time.perf_counter()
+        try:
+            response = await handler(request)
+        except AuthError as e:
+            response = json_response({'msg': str(e)}, e.status)
+        except InvalidParameter as e:
+            response = json_response({'message': str(e)}, 400)
+        except asyncio.TimeoutError:
+            response = json_response({'message': '数据库繁忙，请稍后重试'}, 503)
+        # 与 Flask 接口共用请求指标，/metrics 中一起输出
+        pharmacy.request_count.inc(self.rule, request.method, str(response.status_code))
+        pharmacy.request_latency.observe(time.perf_counter() - started, self.rule, request.method)
+        await response(scope, receive, send)
+
+
+# 事件订阅者：监听线程通过 call_soon_threadsafe 把消息放入事件循环中的队列
+class AsyncSubscription:
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def deliver(self, message):
+        if self.closed:
+            return False
+        self.loop.call_soon_threadsafe(self._put, message)
+        return True
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.closed = True
+
+
+# GET /api/events 的原生异步实现，事件格式和行为与 Flask 的 stream_events 相同，
+# 空闲连接只占用一个协程，不占用线程
+async def stream_events(request):
+    started = time.perf_counter()
+    try:
+        claims = authenticate(request, query_string=True)
+    except AuthError as e:
+        response = json_response({'msg': str(e)}, e.status)
+        pharmacy.request_count.inc('/api/events', request.method, str(response.status_code))
+        return response
+    services = flask_app.extensions['pharmacy']
+    broker, blocklist = services['event_broker'], services['token_blocklist']
+    if not await asyncio.to_thread(broker.ensure_started):
+        return json_response({'message': '事件服务暂不可用，请稍后重试'}, 503)
+    subscription = AsyncSubscription(asyncio.get_running_loop(), flask_app.config['EVENTS_CLIENT_QUEUE'])
+    backlog = broker.subscribe(subscription, request.headers.get('Last-Event-ID'))
+    heartbeat = flask_app.config['EVENTS_HEARTBEAT']
+    pharmacy.request_count.inc('/api/events', request.method, '200')
+    pharmacy.request_latency.observe(time.perf_counter() - started, '/api/events', request.method)
+
+    async def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            for message in backlog:
+                yield message
+            while time.time() < claims['exp'] and not blocklist.is_revoked(claims):
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    if subscription.closed:
+                        return
+                    yield ': keepalive\n\n'
+        finally:
+            broker.unsubscribe(subscription)
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+def create_db_pool(config, min_size, **options):
+    return asyncpg.create_pool(
+        database=config['dbname'],
+        user=config['user'],
+        password=config['password'],
+        host=config['host'],
+        port=int(config['port']),
+        min_size=min_size,
+        max_size=ASYNC_DB_POOL_MAX_SIZE,
+        **options
+    )
+
+
+@contextlib.asynccontextmanager
+async def lifespan(application):
+    application.state.db_pool = await create_db_pool(DB_CONFIG, ASYNC_DB_POOL_MIN_SIZE)
+    # 只读副本的连接池不预先建立连接；副本所在主机不可达时尽快失败，改用其他副本或主库
+    application.state.replica_pools = {
+        replica.name: await create_db_pool(replica.config, 0, timeout=REPLICA_CONNECT_TIMEOUT)
+        for replica in flask_app.extensions['pharmacy']['replica_router'].replicas
+    }
+    # 令牌吊销名单等后台服务与 Flask 应用共用，启动时加载吊销名单并开始后台同步
+    await asyncio.to_thread(pharmacy.start_background_services, flask_app)
+    try:
+        yield
+    finally:
+        await application.state.db_pool.close()
+        for replica_pool in application.state.replica_pools.values():
+            await replica_pool.close()
+
+
+app = Starlette(
+    routes=[
+        Route(SalesCollection.rule, SalesCollection(), methods=['GET', 'POST']),
+        Route('/api/events', stream_events, methods=['GET']),
+        Mount('/', app=flask_wsgi),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=pharmacy.CORS_OPTIONS['origins'],
+            allow_methods=pharmacy.CORS_OPTIONS['methods'],
+            allow_headers=pharmacy.CORS_OPTIONS['allow_headers'],
+            expose_headers=pharmacy.CORS_OPTIONS['expose_headers'],
+            allow_credentials=pharmacy.CORS_OPTIONS['supports_credentials']
+        ),
+    ],
+    lifespan=lifespan
+)
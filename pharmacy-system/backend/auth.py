@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def normalize_method(method):
+    # pbkdf2:sha256 与 werkzeug 生成的哈希前缀 pbkdf2:sha256:<迭代次数> 对齐
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        return f'{method}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+# 密码哈希计算的有界线程池
+# PBKDF2 计算期间释放 GIL，放到专用线程上执行，请求线程只负责等待结果。
+# 同时进行（含排队）的计算超过 workers + max_queue 时立即抛出 HasherBusy，
+# 登录高峰时快速失败而不是占满所有请求线程。线程池在第一次使用时才创建。
+class PasswordHasher:
+    def __init__(self, method='pbkdf2:sha256', workers=2, max_queue=32, timeout=5.0):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self._stats = {'verified': 0, 'hashed': 0, 'rejected': 0, 'timeouts': 0,
+                       'hash_seconds_total': 0.0, 'hash_seconds_max': 0.0}
+
+    def _run(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._pending -= 1
+                self._stats['hash_seconds_total'] += elapsed
+                self._stats['hash_seconds_max'] = max(self._stats['hash_seconds_max'], elapsed)
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self._stats['rejected'] += 1
+                raise HasherBusy('密码校验繁忙')
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            self._pending += 1
+        return self._executor.submit(self._run, fn, *args)
+
+    def _cancel(self, future):
+        # 还在排队的任务取消后不会执行，由这里扣减计数
+        if future.cancel():
+            with self._lock:
+                self._pending -= 1
+
+    def _result(self, future):
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            self._cancel(future)
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise HasherBusy('密码校验超时')
+
+    def verify(self, pwhash, password):
+        result = self._result(self._submit(check_password_hash, pwhash, password))
+        with self._lock:
+            self._stats['verified'] += 1
+        return result
+
+    def hash(self, password):
+        return self.hash_many([password])[0]
+
+    # 批量计算哈希，在线程池上并行执行；任意一个被拒绝时整体抛出 HasherBusy。
+    # 同时提交的任务不超过 workers 个，批量创建用户时不会占满排队名额，登录仍然可以排队
+    def hash_many(self, passwords):
+        passwords = list(passwords)
+        results = []
+        for start in range(0, len(passwords), self.workers):
+            futures = []
+            try:
+                for password in passwords[start:start + self.workers]:
+                    futures.append(self._submit(generate_password_hash, password, self.method))
+            except HasherBusy:
+                for future in futures:
+                    self._cancel(future)
+                raise
+            results.extend(self._result(future) for future in futures)
+        with self._lock:
+            self._stats['hashed'] += len(results)
+        return results
+
+    # 哈希不是当前配置的算法和参数时，登录成功后透明地重新计算
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.method
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'pending': self._pending, 'workers': self.workers, 'max_queue': self.max_queue})
+        return stats
+
+
+# 按键（用户名、IP）的令牌桶限流：每个键最多积累 capacity 个令牌，每秒补充 rate 个，
+# 每次请求消耗一个。键的数量超过 maxsize 时淘汰最久未使用的键。
+class RateLimiter:
+    def __init__(self, rate, capacity, maxsize=10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()   # key -> (tokens, updated_at)
+        self._stats = {'allowed': 0, 'limited': 0}
+
+    # 返回 (是否放行, 需要等待的秒数)
+    def acquire(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            self._stats['allowed' if allowed else 'limited'] += 1
+        if allowed:
+            return True, 0.0
+        return False, (1 - tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['keys'] = len(self._buckets)
+        return stats
@@ -0,0 +1,201 @@
+# 同步 / 异步服务模式的并发连接容量对比
+#
+# 分别启动同步模式（Flask 多线程服务器，psycopg2 连接池）和异步模式（uvicorn + asgi.py，
+# asyncpg 连接池），对每个并发级别建立 N 个保持连接的客户端，在固定时长内反复请求
+# GET /api/sales?limit=20（可用 --mix-sales 混入 POST /api/sales），统计：
+#   - 吞吐量、成功数、错误数（含 503 数据库繁忙和连接失败/超时）
+#   - 延迟 p50 / p99（毫秒）
+#
+# 用法（在 backend 目录下，需要可用的数据库和 requirements-async.txt 中的依赖）：
+#   python benchmarks/bench_async_capacity.py --levels 50,200,500 --duration 10
+# 也可以对已在运行的服务压测：--sync-url http://localhost:5000 --async-url http://localhost:5001
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def start_server(mode, port):
+    if mode == 'sync':
+        command = [sys.executable, '-c',
+                   f"from app import create_app; create_app().run(port={port}, threaded=True)"]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + '/', timeout=1)
+            return process, url
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    process.kill()
+    sys.exit(f'{mode} 模式服务启动失败')
+
+
+def login(url, username, password):
+    request = urllib.request.Request(url + '/api/login', method='POST',
+                                     data=json.dumps({'username': username, 'password': password}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())['access_token']
+
+
+def medicine_ids(url, token):
+    request = urllib.request.Request(url + '/api/medicines?limit=200&fields=id,stock',
+                                     headers={'Authorization': f'Bearer {token}'})
+    with urllib.request.urlopen(request) as response:
+        return [m['id'] for m in json.loads(response.read()) if m['stock'] >= 1000]
+
+
+# 最简单的 HTTP/1.1 保持连接客户端，只处理带 Content-Length 的响应
+class Connection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers, body=b''):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+        lines += [f'{k}: {v}' for k, v in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('连接被关闭')
+        status = int(status_line.split()[1])
+        # HTTP/1.0 响应（如 Werkzeug 开发服务器）默认不保持连接
+        length, close = 0, status_line.startswith(b'HTTP/1.0')
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value.strip().lower() == 'close':
+                close = True
+        await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def run_level(url, token, ids, connections, duration, mix_sales, timeout):
+    target = urlsplit(url)
+    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+    latencies, statuses = [], {}
+    deadline = time.monotonic() + duration
+
+    async def client(seed):
+        rng = random.Random(seed)
+        conn = Connection(target.hostname, target.port)
+        while time.monotonic() < deadline:
+            if mix_sales and rng.random() < mix_sales:
+                method, path = 'POST', '/api/sales'
+                body = json.dumps({'medicine_id': rng.choice(ids), 'quantity': 1}).encode()
+            else:
+                method, path, body = 'GET', '/api/sales?limit=20', b''
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(conn.request(method, path, headers, body), timeout)
+            except asyncio.TimeoutError:
+                status = 'timeout'
+                conn.close()
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+                status = 'connection_error'
+                conn.close()
+                await asyncio.sleep(0.05)
+            elapsed = (time.perf_counter() - started) * 1000
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200:
+                latencies.append(elapsed)
+        conn.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(i) for i in range(connections)))
+    seconds = time.monotonic() - started
+    total = sum(statuses.values())
+    return {
+        'connections': connections,
+        'requests': total,
+        'ok': statuses.get('200', 0),
+        'errors': total - statuses.get('200', 0),
+        'statuses': statuses,
+        'throughput': round(statuses.get('200', 0) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同步/异步服务模式并发连接容量对比')
+    parser.add_argument('--levels', default='50,200,500', help='逗号分隔的并发连接数')
+    parser.add_argument('--duration', type=float, default=10, help='每个并发级别的持续秒数')
+    parser.add_argument('--mix-sales', type=float, default=0.0, help='POST /api/sales 请求的比例（0~1）')
+    parser.add_argument('--timeout', type=float, default=10, help='单个请求的超时秒数')
+    parser.add_argument('--sync-url', help='已运行的同步模式服务地址')
+    parser.add_argument('--async-url', help='已运行的异步模式服务地址')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--output', help='结果 JSON 文件')
+    args = parser.parse_args()
+    levels = [int(v) for v in args.levels.split(',') if v.strip()]
+
+    results = {}
+    for mode, url, port in (('sync', args.sync_url, 5091), ('async', args.async_url, 5092)):
+        process = None
+        if not url:
+            process, url = start_server(mode, port)
+        try:
+            token = login(url, args.username, args.password)
+            ids = medicine_ids(url, token) if args.mix_sales else []
+            if args.mix_sales and not ids:
+                sys.exit('没有库存充足的药品，请先运行 init_db.py --medicines N')
+            results[mode] = []
+            for connections in levels:
+                result = asyncio.run(run_level(url, token, ids, connections, args.duration,
+                                               args.mix_sales, args.timeout))
+                results[mode].append(result)
+                print(f"{mode:<6} 连接 {connections:>5}  成功 {result['ok']:>7}  错误 {result['errors']:>6}  "
+                      f"{result['throughput']:>8} req/s  p50 {result['p50_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                      f"{result['statuses']}")
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'结果已保存到 {args.output}')
+
+
+if __name__ == '__main__':
+    main()
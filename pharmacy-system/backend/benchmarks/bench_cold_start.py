@@ -0,0 +1,59 @@
+# 冷启动基准测试
+#
+# 在新的解释器进程中分别计时：导入 app 模块、create_app()、处理第一个请求（GET /）。
+# 子进程的数据库端口指向一个没有服务监听的端口，用来验证启动过程不连接数据库；
+# 同时检查连接池在第一个请求之后仍未建立任何连接。
+#
+# 用法（在 backend 目录下，不需要数据库）：
+#   python benchmarks/bench_cold_start.py --runs 10
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import json, time
+started = time.perf_counter()
+import app as pharmacy
+imported = time.perf_counter()
+application = pharmacy.create_app()
+created = time.perf_counter()
+response = application.test_client().get('/')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'status': response.status_code,
+    'connections_opened': application.extensions['pharmacy']['pool'].stats()['connections_opened'],
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='冷启动基准测试')
+    parser.add_argument('--runs', type=int, default=10, help='启动次数')
+    args = parser.parse_args()
+
+    env = dict(os.environ, DB_HOST='127.0.0.1', DB_PORT='9', PYTHONDONTWRITEBYTECODE='1')
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([sys.executable, '-c', CHILD], cwd=BACKEND_DIR, env=env)
+        sample = json.loads(output.decode().strip().splitlines()[-1])
+        if sample['status'] != 200 or sample['connections_opened']:
+            sys.exit(f'启动过程访问了数据库或请求失败: {sample}')
+        samples.append(sample)
+
+    print(f'{"阶段":<18}{"中位数 ms":>12}{"最小 ms":>10}{"最大 ms":>10}')
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms'):
+        values = [s[key] for s in samples]
+        print(f'{key:<18}{statistics.median(values):>12.1f}{min(values):>10.1f}{max(values):>10.1f}')
+    print('启动和第一个请求均未连接数据库')
+
+
+if __name__ == '__main__':
+    main()
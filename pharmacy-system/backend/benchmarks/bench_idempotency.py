@@ -0,0 +1,163 @@
+# 销售幂等键基准测试
+#
+# 模拟网络不稳定的收银台：每笔销售带一个 Idempotency-Key，同一个键并发提交 --duplicates 次
+# （多个并发客户端从同一个队列取请求，同一个键的重复请求相邻，基本同时到达），
+# 全部完成后再用同一个键各重试一次（进程内缓存命中）。结束后校验：
+#   - 销售记录条数 == 键的个数，库存只扣减一次
+#   - 同一个键的所有响应返回相同的销售记录 ID，除第一次外都带 Idempotent-Replayed
+#   - 同一个键换一个请求体返回 422
+# 并输出不带键、首次执行、并发重复（等待首次执行提交后重放）和事后重试（进程内缓存）的延迟，
+# 以及幂等键存储的计数。
+#
+# 用法（在 backend 目录下，需要可用的数据库）：
+#   python benchmarks/bench_idempotency.py --keys 500 --duplicates 4 --clients 16
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(name, latencies, seconds=None):
+    line = (f'{name:<10} n={len(latencies):<6} p50={percentile(latencies, 50) * 1000:.2f}ms '
+            f'p95={percentile(latencies, 95) * 1000:.2f}ms p99={percentile(latencies, 99) * 1000:.2f}ms')
+    if seconds:
+        line += f' throughput={len(latencies) / seconds:.1f} req/s'
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='销售幂等键基准测试')
+    parser.add_argument('--keys', type=int, default=500, help='不同幂等键（销售）的个数')
+    parser.add_argument('--duplicates', type=int, default=4, help='每个键并发提交的次数')
+    parser.add_argument('--clients', type=int, default=16, help='并发客户端数')
+    parser.add_argument('--keep', action='store_true', help='保留测试数据')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.clients + 2))
+    import app as pharmacy
+    from flask_jwt_extended import create_access_token
+    from idempotency import key_digest
+    from lots import sync_lots
+    application = pharmacy.create_app()
+    pool = application.extensions['pharmacy']['pool']
+    store = application.extensions['pharmacy']['idempotency']
+    stock = args.keys * 2 + 1
+
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, role FROM users WHERE role = 'admin' ORDER BY id LIMIT 1")
+        admin = cur.fetchone()
+        if not admin:
+            sys.exit('数据库中没有管理员账号，请先运行 init_db.py')
+        cur.execute("""
+            INSERT INTO medicines (name, description, price, stock, manufacturer)
+            VALUES ('幂等压测药品', 'bench', 9.90, %s, 'bench')
+            RETURNING id
+        """, (stock,))
+        medicine_id = cur.fetchone()[0]
+        sync_lots(cur, [medicine_id])
+        conn.commit()
+        cur.close()
+
+    with application.app_context():
+        token = create_access_token(identity=str(admin[0]), additional_claims={'role': admin[1]})
+    body = {'medicine_id': medicine_id, 'quantity': 1}
+
+    lock = threading.Lock()
+
+    # 并发执行 requests 中的 (幂等键或 None, 请求体)，返回 [(键, 状态码, 销售记录 ID, 是否重放, 耗时)] 和总耗时
+    def run(requests):
+        queue = list(reversed(requests))
+        results = []
+
+        def client_loop():
+            client = application.test_client()
+            local = []
+            while True:
+                with lock:
+                    if not queue:
+                        break
+                    key, payload = queue.pop()
+                headers = {'Authorization': f'Bearer {token}'}
+                if key:
+                    headers['Idempotency-Key'] = key
+                started = time.perf_counter()
+                resp = client.post('/api/sales', headers=headers, json=payload)
+                elapsed = time.perf_counter() - started
+                sale_id = resp.get_json().get('id') if resp.status_code == 200 else None
+                local.append((key, resp.status_code, sale_id, resp.headers.get('Idempotent-Replayed') == 'true',
+                              elapsed))
+            with lock:
+                results.extend(local)
+
+        threads = [threading.Thread(target=client_loop) for _ in range(args.clients)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, time.perf_counter() - started
+
+    keys = [str(uuid.uuid4()) for _ in range(args.keys)]
+    baseline, baseline_seconds = run([(None, body)] * args.keys)
+    concurrent, concurrent_seconds = run([(key, body) for key in keys for _ in range(args.duplicates)])
+    retried, retried_seconds = run([(key, body) for key in keys])
+    mismatched, _ = run([(key, dict(body, quantity=2)) for key in keys[:10]])
+
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT stock FROM medicines WHERE id = %s", (medicine_id,))
+        final_stock = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*) FROM sales_records WHERE medicine_id = %s", (medicine_id,))
+        record_count = cur.fetchone()[0]
+        if not args.keep:
+            cur.execute("DELETE FROM idempotency_keys WHERE key = ANY(%s)",
+                        ([key_digest(admin[0], key) for key in keys],))
+            cur.execute("DELETE FROM sales_records WHERE medicine_id = %s", (medicine_id,))
+            cur.execute("DELETE FROM sales_daily_rollup WHERE medicine_id = %s", (medicine_id,))
+            cur.execute("DELETE FROM medicines WHERE id = %s", (medicine_id,))
+            conn.commit()
+        cur.close()
+
+    by_key = {}
+    for key, status, sale_id, replayed, _ in concurrent + retried:
+        by_key.setdefault(key, []).append((status, sale_id, replayed))
+    first = [r[4] for r in concurrent if r[1] == 200 and not r[3]]
+    replays = [r[4] for r in concurrent if r[3]]
+    checks = {
+        'baseline sales succeeded': all(r[1] == 200 for r in baseline),
+        'one sale per key': record_count == len(baseline) + args.keys,
+        'stock decremented once per key': final_stock == stock - len(baseline) - args.keys,
+        'duplicates return the same sale': all(
+            len({r[1] for r in responses}) == 1 and all(r[0] == 200 for r in responses)
+            for responses in by_key.values()
+        ),
+        'one execution per key': len(first) == args.keys,
+        'reused key with another body -> 422': all(r[1] == 422 for r in mismatched),
+    }
+    print(f'keys={args.keys} duplicates={args.duplicates} clients={args.clients}')
+    summarize('no key', [r[4] for r in baseline], baseline_seconds)
+    summarize('first', first)
+    summarize('replay', replays)
+    summarize('retry', [r[4] for r in retried], retried_seconds)
+    print(f'concurrent phase: {len(concurrent)} requests in {concurrent_seconds:.3f}s')
+    print('idempotency:', store.stats())
+    for name, passed in checks.items():
+        print(f'[{"PASS" if passed else "FAIL"}] {name}')
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
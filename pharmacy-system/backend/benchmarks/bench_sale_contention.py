@@ -0,0 +1,134 @@
+# 热点药品并发销售基准测试
+#
+# N 个并发销售线程对同一个药品反复提交 POST /api/sales（每次数量 1），
+# 直到库存售罄。结束后校验：
+#   - 成功销售次数 == 初始库存
+#   - 最终库存 == 0，且从未出现负库存
+#   - 该药品的销售记录条数和数量合计与成功次数一致
+# 并输出吞吐量、延迟分位数和 create_sale 的竞争/重试指标。
+#
+# 用法（在 backend 目录下，需要可用的数据库）：
+#   python benchmarks/bench_sale_contention.py --sellers 16 --stock 2000
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='热点药品并发销售基准测试')
+    parser.add_argument('--sellers', type=int, default=16, help='并发销售线程数')
+    parser.add_argument('--stock', type=int, default=2000, help='热点药品初始库存')
+    parser.add_argument('--keep', action='store_true', help='保留测试数据')
+    args = parser.parse_args()
+
+    # 连接池需要容纳所有销售线程
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.sellers + 2))
+    import app as pharmacy
+    from flask_jwt_extended import create_access_token
+    from lots import sync_lots
+    application = pharmacy.create_app()
+    pool = application.extensions['pharmacy']['pool']
+
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, role FROM users WHERE role = 'admin' ORDER BY id LIMIT 1")
+        admin = cur.fetchone()
+        if not admin:
+            sys.exit('数据库中没有管理员账号，请先运行 init_db.py')
+        cur.execute("""
+            INSERT INTO medicines (name, description, price, stock, manufacturer)
+            VALUES ('压测热点药品', 'bench', 9.90, %s, 'bench')
+            RETURNING id
+        """, (args.stock,))
+        medicine_id = cur.fetchone()[0]
+        # 库存记为未分批批次，与添加药品接口一致
+        sync_lots(cur, [medicine_id])
+        conn.commit()
+        cur.close()
+
+    with application.app_context():
+        token = create_access_token(identity=str(admin[0]), additional_claims={'role': admin[1]})
+    headers = {'Authorization': f'Bearer {token}'}
+
+    lock = threading.Lock()
+    results = {'ok': 0, 'out_of_stock': 0, 'errors': 0}
+    latencies = []
+
+    def seller():
+        client = application.test_client()
+        local = []
+        while True:
+            started = time.perf_counter()
+            resp = client.post('/api/sales', headers=headers, json={'medicine_id': medicine_id, 'quantity': 1})
+            local.append(time.perf_counter() - started)
+            with lock:
+                if resp.status_code == 200:
+                    results['ok'] += 1
+                    continue
+                if resp.status_code == 400:
+                    results['out_of_stock'] += 1
+                else:
+                    results['errors'] += 1
+            break
+        with lock:
+            latencies.extend(local)
+
+    before = pharmacy.sale_metrics.snapshot()
+    threads = [threading.Thread(target=seller) for _ in range(args.sellers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    after = pharmacy.sale_metrics.snapshot()
+
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT stock FROM medicines WHERE id = %s", (medicine_id,))
+        final_stock = cur.fetchone()[0]
+        cur.execute("SELECT COUNT(*), COALESCE(SUM(quantity), 0) FROM sales_records WHERE medicine_id = %s",
+                    (medicine_id,))
+        record_count, record_quantity = cur.fetchone()
+        if not args.keep:
+            cur.execute("DELETE FROM sales_records WHERE medicine_id = %s", (medicine_id,))
+            cur.execute("DELETE FROM sales_daily_rollup WHERE medicine_id = %s", (medicine_id,))
+            cur.execute("DELETE FROM medicines WHERE id = %s", (medicine_id,))
+            conn.commit()
+        cur.close()
+
+    checks = {
+        'sold == initial stock': results['ok'] == args.stock,
+        'final stock == 0': final_stock == 0,
+        'records == sold': record_count == results['ok'] and record_quantity == results['ok'],
+        'no errors': results['errors'] == 0,
+    }
+    print(f'sellers={args.sellers} stock={args.stock} elapsed={elapsed:.3f}s')
+    print(f'sold={results["ok"]} rejected={results["out_of_stock"]} errors={results["errors"]} '
+          f'final_stock={final_stock} records={record_count}')
+    print(f'throughput={results["ok"] / elapsed:.1f} sales/s '
+          f'p50={percentile(latencies, 50) * 1000:.2f}ms '
+          f'p95={percentile(latencies, 95) * 1000:.2f}ms '
+          f'p99={percentile(latencies, 99) * 1000:.2f}ms')
+    print('metrics:', {
+        k: round(v if k.endswith('_max') else v - before.get(k, 0), 4) for k, v in after.items()
+    })
+    for name, passed in checks.items():
+        print(f'[{"PASS" if passed else "FAIL"}] {name}')
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# 列表响应序列化耗时和体积对比
+#
+# 用与药品列表相同结构的行（Decimal 价格、datetime 时间）比较：
+#   - legacy：逐行构建 dict、float() / isoformat() 逐个转换后 json.dumps（原先 jsonify 的做法）
+#   - json / orjson：serialization.ResponseEncoder，逐行对象和按列（compact）两种格式
+# 并输出 gzip / brotli（已安装时）压缩后的体积和耗时。不需要数据库。
+#
+# 用法（在 backend 目录下）：
+#   python benchmarks/bench_serialization.py --rows 10000 --repeat 20
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import ENCODERS, ResponseEncoder  # noqa: E402
+
+COLUMNS = ('id', 'name', 'description', 'price', 'stock', 'manufacturer', 'created_at', 'updated_at')
+
+
+def make_rows(count, seed):
+    rng = random.Random(seed)
+    now = datetime(2024, 1, 1)
+    return [(
+        i,
+        f'药品{i:06d}',
+        f'{rng.randint(1, 500)}mg*{rng.randint(6, 48)}/盒',
+        Decimal(rng.randint(100, 50000)) / 100,
+        rng.randint(0, 5000),
+        rng.choice(('华北制药', '哈药集团制药总厂', '石药集团', '云南白药')),
+        now + timedelta(seconds=i),
+        now + timedelta(seconds=i, microseconds=rng.randint(0, 999999)),
+    ) for i in range(count)]
+
+
+def legacy(rows):
+    return json.dumps([{
+        'id': r[0], 'name': r[1], 'description': str(r[2]), 'price': float(r[3]), 'stock': r[4],
+        'manufacturer': r[5], 'created_at': r[6].isoformat(), 'updated_at': r[7].isoformat()
+    } for r in rows], sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='列表响应序列化耗时和体积对比')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rows = make_rows(args.rows, args.seed)
+
+    print(f'{args.rows} 行，取 {args.repeat} 次中最快的一次')
+    ms, body = timed(lambda: legacy(rows), args.repeat)
+    print(f'{"legacy":<16} {ms:>9.2f} ms  {len(body):>10} 字节')
+    for name in ENCODERS:
+        encoder = ResponseEncoder(encoder=name)
+        for compact in (False, True):
+            label = f'{name}{" compact" if compact else ""}'
+            ms, body = timed(lambda: encoder.encode_rows(COLUMNS, rows, compact), args.repeat)
+            print(f'{label:<16} {ms:>9.2f} ms  {len(body):>10} 字节')
+            for encoding in encoder.encodings:
+                ms, (compressed, _) = timed(lambda: encoder.compress(body, encoding), max(1, args.repeat // 4))
+                print(f'  + {encoding:<12} {ms:>9.2f} ms  {len(compressed):>10} 字节')
+
+
+if __name__ == '__main__':
+    main()
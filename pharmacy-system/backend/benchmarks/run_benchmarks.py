@@ -0,0 +1,327 @@
+# API 压测套件
+#
+# 依次对每个场景发起固定数量的请求（多个并发客户端），统计：
+#   - 吞吐量（请求/秒）、错误数和状态码分布
+#   - 延迟 p50 / p95 / p99 / 平均 / 最大（毫秒）
+#   - 每个请求的平均 SQL 条数和数据库耗时（来自 X-DB-Query-Count / X-DB-Time 响应头）
+# 结果保存为 JSON，可以用 --compare 与之前保存的基线对比。
+#
+# 场景：login（轮流登录 init_db.py --users 生成的 staff_* 账号）、medicines_page、medicines_search、sales_page、stats_revenue、
+#       expiring_lots（近效期报表）、users_page（按用户名前缀筛选的用户列表）、create_sale、
+#       delete_sale（删除本次 create_sale 产生的记录）
+#
+# 用法（在 backend 目录下，需要可用的数据库）：
+#   python init_db.py --medicines 100000 --sales 1000000 --users 100 --lots 3 --seed 1
+#   python benchmarks/run_benchmarks.py --clients 8 --requests 500 --output baseline.json
+#   python benchmarks/run_benchmarks.py --clients 8 --requests 500 --compare baseline.json
+# 默认在进程内通过 Flask test_client 调用；指定 --base-url 时通过 HTTP 压测运行中的服务。
+# 进程内压测时默认放宽登录限流（LOGIN_IP_* / LOGIN_USER_*，可用环境变量覆盖），login 场景测的是密码校验；
+# 压测运行中的服务时按服务端配置限流，被限流的请求（429）单独统计，不计入错误数。
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ['login', 'medicines_page', 'medicines_search', 'sales_page', 'stats_revenue',
+             'expiring_lots', 'users_page', 'create_sale', 'delete_sale']
+SEARCH_TERMS = ['阿莫', '布洛芬', '颗粒', '胶囊', '维生素', '白云山', '同仁堂', '感冒灵', '软膏', '丹参']
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+class Reply:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+# 进程内客户端，每个线程各自持有一个 test_client
+class InProcessClient:
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self._client.open(path, method=method, json=body, headers=headers)
+        return Reply(response.status_code, response.headers, response.get_data())
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self._base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self._base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                return Reply(response.status, response.headers, response.read())
+        except urllib.error.HTTPError as e:
+            return Reply(e.code, e.headers, e.read())
+
+
+class Runner:
+    def __init__(self, make_client, args):
+        self.make_client = make_client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.token = None
+        self.medicine_ids = []
+        self.created_sales = []
+        self.lock = threading.Lock()
+
+    # login 场景使用的 (用户名, 密码)；--login-users 为 0 时只用 --username
+    def login_accounts(self):
+        if not self.args.login_users:
+            return [(self.args.username, self.args.password)]
+        return [(f'staff_{i:06d}', self.args.login_password) for i in range(self.args.login_users)]
+
+    def prepare(self):
+        client = self.make_client()
+        self.accounts = self.login_accounts()
+        reply = client.request('POST', '/api/login', {'username': self.accounts[0][0], 'password': self.accounts[0][1]})
+        if 'login' in self.args.scenarios.split(',') and reply.status != 200:
+            sys.exit(f'login 场景的账号 {self.accounts[0][0]} 登录失败（{reply.status}），'
+                     f'请先运行 init_db.py --users N 或指定 --login-users 0')
+        reply = client.request('POST', '/api/login', {'username': self.args.username, 'password': self.args.password})
+        if reply.status != 200:
+            sys.exit(f'登录失败（{reply.status}）：{reply.body[:200]!r}')
+        self.token = reply.json()['access_token']
+        reply = client.request('GET', '/api/medicines?limit=200&fields=id,stock', token=self.token)
+        self.medicine_ids = [m['id'] for m in reply.json() if m['stock'] >= 100]
+        if not self.medicine_ids:
+            sys.exit('没有库存充足的药品，请先运行 init_db.py --medicines N')
+
+    # 每个场景返回 (method, path, body, token)
+    def next_request(self, scenario, rng):
+        if scenario == 'login':
+            username, password = rng.choice(self.accounts)
+            return 'POST', '/api/login', {'username': username, 'password': password}, None
+        if scenario == 'medicines_page':
+            return 'GET', '/api/medicines?limit=50', None, self.token
+        if scenario == 'medicines_search':
+            return 'GET', f'/api/medicines/search?q={urllib.request.quote(rng.choice(SEARCH_TERMS))}', None, self.token
+        if scenario == 'sales_page':
+            return 'GET', '/api/sales?limit=50', None, self.token
+        if scenario == 'stats_revenue':
+            return 'GET', '/api/stats/revenue?granularity=day', None, self.token
+        if scenario == 'expiring_lots':
+            return 'GET', f'/api/inventory/expiring?days={rng.choice((30, 90, 180))}&limit=100', None, self.token
+        if scenario == 'users_page':
+            return 'GET', f'/api/users?limit=50&username=staff_0000{rng.randrange(10)}', None, self.token
+        if scenario == 'create_sale':
+            return 'POST', '/api/sales', {'medicine_id': rng.choice(self.medicine_ids), 'quantity': 1}, self.token
+        if scenario == 'delete_sale':
+            with self.lock:
+                if not self.created_sales:
+                    return None
+                sale_id = self.created_sales.pop()
+            return 'DELETE', f'/api/sales/{sale_id}', None, self.token
+        raise ValueError(scenario)
+
+    def run_scenario(self, scenario):
+        remaining = [self.args.requests]
+        samples = []
+        statuses = {}
+
+        def worker(seed):
+            client = self.make_client()
+            rng = random.Random(seed)
+            local = []
+            while True:
+                with self.lock:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+                request = self.next_request(scenario, rng)
+                if request is None:
+                    break
+                method, path, body, token = request
+                started = time.perf_counter()
+                try:
+                    reply = client.request(method, path, body, token)
+                    status = reply.status
+                except Exception:
+                    reply, status = None, 'error'
+                elapsed = time.perf_counter() - started
+                queries = db_ms = None
+                if reply is not None:
+                    queries = reply.headers.get('X-DB-Query-Count')
+                    db_ms = reply.headers.get('X-DB-Time')
+                    if scenario == 'create_sale' and status == 200:
+                        with self.lock:
+                            self.created_sales.append(reply.json()['id'])
+                local.append((elapsed, status, queries, db_ms))
+            with self.lock:
+                samples.extend(local)
+
+        threads = [threading.Thread(target=worker, args=(self.rng.random(),)) for _ in range(self.args.clients)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        seconds = time.perf_counter() - started
+
+        latencies = [s[0] * 1000 for s in samples]
+        for _, status, _, _ in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        rate_limited = sum(1 for _, status, _, _ in samples if status == 429)
+        errors = sum(1 for _, status, _, _ in samples if status == 'error' or status >= 400) - rate_limited
+        queries = [int(s[2]) for s in samples if s[2] is not None]
+        db_ms = [float(s[3]) for s in samples if s[3] is not None]
+        return {
+            'requests': len(samples),
+            'errors': errors,
+            'rate_limited': rate_limited,
+            'status_counts': statuses,
+            'seconds': round(seconds, 3),
+            'throughput': round(len(samples) / seconds, 1) if seconds else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'mean': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+                'max': round(max(latencies), 2) if latencies else 0.0,
+            },
+            'db_queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'db_ms_mean': round(sum(db_ms) / len(db_ms), 2) if db_ms else None,
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def print_results(results, baseline=None):
+    header = f"{'场景':<18}{'请求':>7}{'错误':>6}{'429':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL':>6}{'DB ms':>8}"
+    print(header)
+    for name, r in results['scenarios'].items():
+        lat = r['latency_ms']
+        print(f"{name:<18}{r['requests']:>7}{r['errors']:>6}{r.get('rate_limited', 0):>6}{r['throughput']:>9}"
+              f"{lat['p50']:>9}{lat['p95']:>9}{lat['p99']:>9}"
+              f"{r['db_queries_mean'] if r['db_queries_mean'] is not None else '-':>6}"
+              f"{r['db_ms_mean'] if r['db_ms_mean'] is not None else '-':>8}")
+    if not baseline:
+        return
+
+    def delta(new, old):
+        if not old:
+            return '-'
+        return f'{(new - old) / old * 100:+.1f}%'
+
+    print(f"\n与基线对比（{baseline['meta'].get('git_revision')} @ {baseline['meta'].get('timestamp')}）")
+    print(f"{'场景':<18}{'req/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'SQL':>8}")
+    for name, r in results['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if not old:
+            continue
+        lat, old_lat = r['latency_ms'], old['latency_ms']
+        queries = '-'
+        if r['db_queries_mean'] is not None and old.get('db_queries_mean') is not None:
+            queries = f"{r['db_queries_mean'] - old['db_queries_mean']:+.2f}"
+        print(f"{name:<18}{delta(r['throughput'], old['throughput']):>10}"
+              f"{delta(lat['p50'], old_lat['p50']):>10}{delta(lat['p95'], old_lat['p95']):>10}"
+              f"{delta(lat['p99'], old_lat['p99']):>10}{queries:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API 压测套件')
+    parser.add_argument('--clients', type=int, default=8, help='并发客户端数')
+    parser.add_argument('--requests', type=int, default=500, help='每个场景的请求数')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='逗号分隔的场景列表')
+    parser.add_argument('--base-url', help='压测运行中的服务，例如 http://localhost:5000')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--login-users', type=int, default=100,
+                        help='login 场景轮流使用的 staff_* 账号数（init_db.py --users 生成），0 表示只用 --username')
+    parser.add_argument('--login-password', default='staff123', help='staff_* 账号的密码')
+    parser.add_argument('--seed', type=int, default=1, help='随机数种子')
+    parser.add_argument('--output', help='结果 JSON 文件')
+    parser.add_argument('--compare', help='基线结果 JSON 文件')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        sys.exit(f'未知场景: {", ".join(unknown)}')
+
+    if args.base_url:
+        def make_client():
+            return HttpClient(args.base_url)
+    else:
+        # 连接池需要容纳所有客户端
+        os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.clients + 2))
+        # 所有请求来自同一个地址，放宽登录限流
+        for name in ('LOGIN_IP_RATE', 'LOGIN_IP_BURST', 'LOGIN_USER_RATE', 'LOGIN_USER_BURST'):
+            os.environ.setdefault(name, '1000000')
+        import app as pharmacy
+        application = pharmacy.create_app()
+
+        def make_client():
+            return InProcessClient(application)
+
+    runner = Runner(make_client, args)
+    runner.prepare()
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'mode': 'http' if args.base_url else 'in-process',
+            'base_url': args.base_url,
+            'clients': args.clients,
+            'requests': args.requests,
+            'seed': args.seed,
+        },
+        'scenarios': {},
+    }
+    for scenario in scenarios:
+        results['scenarios'][scenario] = runner.run_scenario(scenario)
+    # delete_sale 没有运行时清理本次产生的销售记录
+    leftover = runner.created_sales
+    if leftover:
+        client = make_client()
+        for sale_id in leftover:
+            client.request('DELETE', f'/api/sales/{sale_id}', token=runner.token)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'\n结果已保存到 {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+# 数据库连接参数，可通过环境变量覆盖
+DB_CONFIG = {
+    'dbname': os.environ.get('DB_NAME', 'pharmacy'),
+    'user': os.environ.get('DB_USER', 'pharm_user'),
+    'password': os.environ.get('DB_PASSWORD', 'Pharm_pass123!'),
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'port': os.environ.get('DB_PORT', '8888'),
+}
+
+
+# 超过该耗时（毫秒）的 SQL 语句写入慢查询日志
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+
+slow_query_log = logging.getLogger('pharmacy.slow_query')
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# 按请求统计 SQL 语句条数、耗时和新建连接耗时，请求开始时调用 start_query_stats()
+_query_stats = contextvars.ContextVar('query_stats', default=None)
+
+
+def start_query_stats():
+    stats = {'count': 0, 'seconds': 0.0, 'connect_seconds': 0.0}
+    _query_stats.set(stats)
+    return stats
+
+
+def current_query_stats():
+    return _query_stats.get()
+
+
+def _record_query(seconds, query):
+    stats = _query_stats.get()
+    if stats is not None:
+        stats['count'] += 1
+        stats['seconds'] += seconds
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        slow_query_log.warning('慢查询 %.1f ms: %s', seconds * 1000, ' '.join(str(query).split())[:500])
+
+
+# 连接池创建的连接默认使用该游标，记录每条语句的耗时
+class CountingCursor(extensions.cursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record_query(time.perf_counter() - started, query)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record_query(time.perf_counter() - started, query)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _record_query(time.perf_counter() - started, sql)
+
+
+# 有界、线程安全的 psycopg2 连接池
+# - min_size: 空闲回收时至少保留的连接数
+# - max_size: 同时打开的最大连接数，超过后借用方排队等待
+# - timeout: 借用连接的最长等待秒数，超时抛出 PoolTimeout
+# - max_idle: 空闲超过该秒数的连接会被关闭
+# - max_lifetime: 连接存活超过该秒数后不再复用
+class ConnectionPool:
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, timeout=5.0,
+                 max_idle=300.0, max_lifetime=1800.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError('连接池大小配置错误')
+        self._connect_kwargs = dict(connect_kwargs)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle = []          # [(conn, last_used)]，末尾为最近归还的连接
+        self._born = {}          # id(conn) -> 创建时间
+        self._size = 0           # 已打开（含正在创建）的连接数
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'waits': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'connect_errors': 0,
+            'connect_seconds_total': 0.0,
+            'connect_seconds_max': 0.0,
+            'peak_in_use': 0,
+        }
+
+    def _expired(self, conn, now):
+        return now - self._born.get(id(conn), now) > self.max_lifetime
+
+    def _discard(self, conn):
+        # 调用方需持有锁
+        self._born.pop(id(conn), None)
+        self._size -= 1
+        self._stats['connections_closed'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _prune_idle(self, now):
+        # 调用方需持有锁；从最久未使用的一端开始回收
+        keep = []
+        for conn, last_used in self._idle:
+            stale = now - last_used > self.max_idle and self._size > self.min_size
+            if conn.closed or stale or self._expired(conn, now):
+                self._discard(conn)
+            else:
+                keep.append((conn, last_used))
+        self._idle = keep
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout('连接池已关闭')
+                self._prune_idle(time.monotonic())
+                if self._idle:
+                    conn, _ = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout('获取数据库连接超时')
+                if not waited:
+                    waited = True
+                    self._stats['waits'] += 1
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+            if waited:
+                elapsed = time.monotonic() - start
+                self._stats['wait_seconds_total'] += elapsed
+                self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], elapsed)
+
+        if conn is None:
+            # 在锁外建立新连接，避免阻塞其他借用方
+            connect_started = time.monotonic()
+            try:
+                conn = psycopg2.connect(cursor_factory=CountingCursor, **self._connect_kwargs)
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._in_use -= 1
+                    self._stats['connect_errors'] += 1
+                    self._cond.notify()
+                raise
+            connect_seconds = time.monotonic() - connect_started
+            with self._cond:
+                self._born[id(conn)] = time.monotonic()
+                self._stats['connections_opened'] += 1
+                self._stats['connect_seconds_total'] += connect_seconds
+                self._stats['connect_seconds_max'] = max(self._stats['connect_seconds_max'], connect_seconds)
+            stats = _query_stats.get()
+            if stats is not None:
+                stats['connect_seconds'] += connect_seconds
+        return conn
+
+    def putconn(self, conn, discard=False):
+        # 归还前回滚未提交的事务，保证下一个借用方拿到干净的连接
+        if not conn.closed and not discard:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            now = time.monotonic()
+            if discard or conn.closed or self._closed or self._expired(conn, now):
+                self._discard(conn)
+            else:
+                self._idle.append((conn, now))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    # 关闭全部空闲连接。数据库重启或不可用后调用，避免之后借出已经断开的连接
+    def discard_idle(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        stats['saturation'] = round(stats['in_use'] / self.max_size, 3)
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._cond.notify_all()
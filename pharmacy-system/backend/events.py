@@ -0,0 +1,183 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+import uuid
+
+import psycopg2
+
+log = logging.getLogger('pharmacy.events')
+
+# 变更事件的 NOTIFY 频道
+CHANNEL = 'pharmacy_events'
+
+
+# 事件编码为 NOTIFY 的载荷，同步模式和异步模式共用
+def encode_events(events):
+    return [
+        json.dumps({'type': event_type, 'data': data}, ensure_ascii=False, separators=(',', ':'))
+        for event_type, data in events
+    ]
+
+
+# 参数见 notify_params，异步模式（asgi.py）转换占位符后直接执行
+NOTIFY_SQL = "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload"
+
+
+def notify_params(events):
+    return CHANNEL, encode_events(events)
+
+
+# 在写事务中发送变更事件，events 为 [(类型, 数据), ...]。
+# NOTIFY 随事务提交才送达，回滚的事务不会产生事件；多个事件合并为一条语句
+def notify(cur, events):
+    cur.execute(NOTIFY_SQL, notify_params(events))
+
+
+def sse_message(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'
+
+
+# 浏览器按 Last-Event-ID 重连时无法补发（事件已移出缓冲区或来自另一个进程/另一次连接），
+# 客户端收到 reset 后应重新拉取完整列表
+RESET_MESSAGE = 'event: reset\ndata: {}\n\n'
+
+
+# 每个 SSE 连接的待发送队列，消费太慢导致队列满时标记为关闭，
+# 连接发完已入队的事件后结束，浏览器重连时按 Last-Event-ID 从缓冲区补发
+class Subscription:
+    def __init__(self, maxsize=256):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def deliver(self, message):
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.closed = True
+            return False
+
+
+# 变更事件的进程内分发
+# 每个进程用一个专用连接 LISTEN 变更频道（第一个订阅者出现时才建立），收到的事件编号后
+# 放入环形缓冲区并分发给本进程的所有订阅者。事件编号为 <流ID>-<序号>，流ID 在每次（重新）
+# LISTEN 时生成，重连期间可能漏收事件，此时向现有订阅者发送 reset。
+class EventBroker:
+    def __init__(self, db_config, buffer_size=1000):
+        self.db_config = db_config
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._started = False
+        self._ready = threading.Event()
+        self._stream = None
+        self._seq = 0
+        self._buffer = []               # [(序号, 消息)]，按序号递增
+        self._subscribers = set()
+        self._stats = {'published': 0, 'delivered': 0, 'slow_subscribers': 0, 'reconnects': 0,
+                       'resets': 0}
+
+    # 启动监听线程并等待 LISTEN 就绪，返回是否就绪
+    def ensure_started(self, timeout=5.0):
+        with self._lock:
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._run, name='event-listener', daemon=True).start()
+        return self._ready.wait(timeout)
+
+    # 注册订阅者并返回需要先发送的消息：按 last_event_id 补发缓冲区中之后的事件，
+    # 无法补发时返回 reset。注册和读取缓冲区在同一把锁内，不会漏掉或重复事件
+    def subscribe(self, subscriber, last_event_id=None):
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if not last_event_id:
+                return []
+            stream, _, seq = last_event_id.partition('-')
+            try:
+                seq = int(seq)
+            except ValueError:
+                seq = None
+            oldest = self._buffer[0][0] if self._buffer else self._seq + 1
+            if stream != self._stream or seq is None or seq > self._seq or seq < oldest - 1:
+                self._stats['resets'] += 1
+                return [RESET_MESSAGE]
+            return [message for s, message in self._buffer if s > seq]
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _publish(self, payload):
+        try:
+            event = json.loads(payload)
+            event_type = event['type']
+            data = json.dumps(event['data'], ensure_ascii=False, separators=(',', ':'))
+        except (ValueError, KeyError, TypeError):
+            log.warning('忽略格式错误的事件: %r', payload)
+            return
+        with self._lock:
+            self._seq += 1
+            message = sse_message(f'{self._stream}-{self._seq}', event_type, data)
+            self._buffer.append((self._seq, message))
+            if len(self._buffer) > self.buffer_size:
+                del self._buffer[:len(self._buffer) - self.buffer_size]
+            subscribers = list(self._subscribers)
+            self._stats['published'] += 1
+        slow = [s for s in subscribers if not s.deliver(message)]
+        with self._lock:
+            self._stats['delivered'] += len(subscribers) - len(slow)
+            self._stats['slow_subscribers'] += len(slow)
+            for subscriber in slow:
+                self._subscribers.discard(subscriber)
+
+    def _listen(self):
+        conn = psycopg2.connect(**self.db_config)
+        try:
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f'LISTEN {CHANNEL}')
+            with self._lock:
+                reconnect = self._stream is not None
+                self._stream = uuid.uuid4().hex[:8]
+                self._seq = 0
+                self._buffer = []
+                subscribers = list(self._subscribers) if reconnect else []
+                if reconnect:
+                    self._stats['reconnects'] += 1
+            # 断线期间的事件已经丢失，通知现有订阅者重新拉取
+            for subscriber in subscribers:
+                subscriber.deliver(RESET_MESSAGE)
+            self._ready.set()
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    # 长时间没有事件时检查连接是否仍然可用
+                    cur.execute('SELECT 1')
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._publish(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def _run(self):
+        delay = 1.0
+        while True:
+            started = time.monotonic()
+            try:
+                self._listen()
+            except Exception:
+                # 连接稳定运行过一段时间则重置退避
+                if time.monotonic() - started > 60:
+                    delay = 1.0
+                log.exception('监听变更事件失败，%s 秒后重连', delay)
+            time.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['subscribers'] = len(self._subscribers)
+            stats['buffered'] = len(self._buffer)
+        return stats
@@ -0,0 +1,8 @@
+# gunicorn 配置，在 backend 目录下启动时自动加载：gunicorn 'app:create_app()'
+
+
+# 每个 worker 加载应用之后启动本进程的后台线程。--preload 时应用在主进程中创建，
+# 在那里启动的线程 fork 之后不存在，因此放在 worker 初始化之后
+def post_worker_init(worker):
+    from app import start_background_services
+    start_background_services(worker.wsgi)
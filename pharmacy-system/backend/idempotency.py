@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from pagination import InvalidParameter
+
+log = logging.getLogger('pharmacy.idempotency')
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# 每次最多删除的过期记录数，避免长时间持有锁
+PURGE_BATCH = 10000
+
+
+# 同一个幂等键用于请求体不同的请求
+class IdempotencyMismatch(Exception):
+    pass
+
+
+# 数据库和缓存中只保存用户 ID 与客户端键的 16 字节摘要，不同用户的键互不影响
+def key_digest(user_id, key):
+    return hashlib.blake2b(f'{user_id}:{key}'.encode('utf-8'), digest_size=16).digest()
+
+
+def request_fingerprint(method, path, body):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{method} {path}\n'.encode('utf-8'))
+    digest.update(body or b'')
+    return digest.digest()
+
+
+# 解析 Idempotency-Key 请求头，返回 (键摘要, 请求指纹)，没有该请求头时返回 None。同步和异步模式共用
+def request_key(header, user_id, method, path, body):
+    if header is None:
+        return None
+    key = header.strip()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise InvalidParameter(f'Idempotency-Key 不能为空且不超过 {IDEMPOTENCY_KEY_MAX_LENGTH} 个字符')
+    return key_digest(user_id, key), request_fingerprint(method, path, body)
+
+
+# 在业务事务的第一条语句中抢占幂等键。键已存在时等待持有它的事务结束：提交了则冲突、
+# 不返回行，之后读取保存的响应；回滚了则由本事务插入。已过期的键可以重新使用
+CLAIM_SQL = """
+    INSERT INTO idempotency_keys AS k (key, fingerprint, expires_at)
+    VALUES (%s, %s, now() + %s::float8 * interval '1 second')
+    ON CONFLICT (key) DO UPDATE
+    SET fingerprint = EXCLUDED.fingerprint, status = NULL, response = NULL, expires_at = EXCLUDED.expires_at
+    WHERE k.expires_at < now()
+    RETURNING 1
+"""
+STORED_SQL = "SELECT fingerprint, status, response FROM idempotency_keys WHERE key = %s"
+# 与业务数据在同一个事务中提交
+SAVE_SQL = "UPDATE idempotency_keys SET status = %s, response = %s WHERE key = %s"
+
+
+# 幂等键存储：请求带 Idempotency-Key 时，成功的响应与业务数据在同一个事务中保存到
+# idempotency_keys，ttl 秒内同一个键的重复请求直接返回保存的响应，不再执行。
+# 失败（事务回滚）的请求不保存，可以用同一个键重试。
+# 最近的结果同时缓存在进程内（最多 cache_size 条），重复请求多数不访问数据库；
+# 后台线程每 purge_interval 秒分批删除过期的记录
+class IdempotencyStore:
+    def __init__(self, ttl=86400.0, cache_size=10000, purge_interval=300.0):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # 键摘要 -> (请求指纹, 状态码, 响应体, 过期时间)
+        self._pool = None
+        self._stats = {'claimed': 0, 'replayed': 0, 'cache_hits': 0, 'mismatches': 0,
+                       'purged': 0, 'purge_errors': 0}
+
+    def _check(self, fingerprint, stored_fingerprint):
+        if stored_fingerprint != fingerprint:
+            with self._lock:
+                self._stats['mismatches'] += 1
+            raise IdempotencyMismatch('该 Idempotency-Key 已用于其他请求')
+
+    # 进程内缓存中的响应 (状态码, 响应体)，没有时返回 None
+    def lookup(self, key, fingerprint):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        self._check(fingerprint, entry[0])
+        with self._lock:
+            self._stats['cache_hits'] += 1
+        return entry[1], entry[2]
+
+    # 抢占成功返回 None，调用方继续执行并在提交前调用 save；
+    # 否则返回已保存的响应 (状态码, 响应体)，调用方回滚事务后原样返回
+    def claim(self, cur, key, fingerprint):
+        cur.execute(CLAIM_SQL, (key, fingerprint, self.ttl))
+        if cur.fetchone() is not None:
+            with self._lock:
+                self._stats['claimed'] += 1
+            return None
+        cur.execute(STORED_SQL, (key,))
+        return self.replay(key, fingerprint, cur.fetchone())
+
+    # 抢占失败时读到的 (请求指纹, 状态码, 响应体)；异步模式用 asyncpg 执行同样的 SQL 后调用
+    def replay(self, key, fingerprint, row):
+        stored_fingerprint, status, body = bytes(row[0]), row[1], bytes(row[2])
+        self._check(fingerprint, stored_fingerprint)
+        self.remember(key, fingerprint, status, body)
+        with self._lock:
+            self._stats['replayed'] += 1
+        return status, body
+
+    def save(self, cur, key, status, body):
+        cur.execute(SAVE_SQL, (status, body, key))
+
+    # 事务提交后调用
+    def remember(self, key, fingerprint, status, body):
+        with self._lock:
+            self._entries[key] = (fingerprint, status, body, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.cache_size:
+                self._entries.popitem(last=False)
+
+    def ensure_started(self, pool):
+        with self._lock:
+            if self._pool is not None:
+                return
+            self._pool = pool
+        threading.Thread(target=self._run, name='idempotency-purge', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.purge_interval)
+            try:
+                self.purge()
+            except Exception:
+                with self._lock:
+                    self._stats['purge_errors'] += 1
+                log.exception('清理过期幂等键失败')
+
+    def purge(self):
+        total = 0
+        with self._pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                while True:
+                    cur.execute("""
+                        DELETE FROM idempotency_keys
+                        WHERE key IN (
+                            SELECT key FROM idempotency_keys WHERE expires_at < now() LIMIT %s
+                        )
+                    """, (PURGE_BATCH,))
+                    deleted = cur.rowcount
+                    conn.commit()
+                    total += deleted
+                    if deleted < PURGE_BATCH:
+                        break
+            finally:
+                cur.close()
+        with self._lock:
+            self._stats['purged'] += total
+        return total
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
@@ -1,24 +1,107 @@
-import psycopg2
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
+import argparse
+import io
 import random
+from psycopg2.extras import execute_values
+from db_pool import ConnectionPool, DB_CONFIG
+from migrations import migrate, PARTITION_MONTHS_AHEAD
+from partitions import ensure_partitions
 
-def get_db_connection():
-    return psycopg2.connect(
-        host="localhost",
-        port="8888",
-        database="pharmacy",
-        user="pharm_user",
-        password="Pharm_pass123!"
-    )
+# 初始化脚本只需要一个连接
+pool = ConnectionPool(DB_CONFIG, min_size=0, max_size=1)
 
-def init_database():
-    conn = get_db_connection()
+COPY_BATCH = 100000
+VOLUME_STOCK = 1000000
+
+# 压测数据的药品名称由常见药名用字随机组合，末尾加编号保证唯一
+NAME_CHARS = '阿莫西林胶囊布洛芬片感冒灵颗粒维生素板蓝根创可贴红霉素软膏藿香正气水复方丹参金银花露头孢克肟氨溴索氯雷他定奥美拉唑'
+FORMS = ['片', '胶囊', '颗粒', '口服液', '软膏', '注射液']
+MANUFACTURERS = ['哈药集团制药总厂', '上海信谊药厂', '白云山制药', '北京同仁堂', '云南白药',
+                 '华润三九', '扬子江药业', '石药集团', '修正药业', '广州白云山']
+
+def copy_rows(cur, table, columns, rows):
+    buffer = io.StringIO()
+    buffer.writelines('\t'.join(str(v) for v in row) + '\n' for row in rows)
+    buffer.seek(0)
+    cur.copy_from(buffer, table, columns=columns)
+
+def batched(rows, size=COPY_BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# 把每种药品的库存拆成 per_medicine 个批次（余数计入第一个批次），第 n 个批次的有效期
+# 在 (n - 1) * 180 - 30 到 n * 180 - 30 天之后，第一个批次中有少量已过期
+def seed_lots(cur, per_medicine):
+    if per_medicine < 1:
+        raise ValueError('每种药品至少一个批次')
+    cur.execute("""
+        INSERT INTO medicine_lots (medicine_id, lot_number, expiry_date, quantity)
+        SELECT m.id, format('L%%s-%%s', m.id, n),
+               CURRENT_DATE + (n - 1) * 180 + (random() * 180)::int - 30,
+               m.stock / %s + CASE WHEN n = 1 THEN m.stock %% %s ELSE 0 END
+        FROM medicines m, generate_series(1, %s) AS n
+        WHERE m.stock / %s + CASE WHEN n = 1 THEN m.stock %% %s ELSE 0 END > 0
+    """, (per_medicine,) * 5)
+    return cur.rowcount
+
+# 生成大规模压测数据：销售人员、药品和销售记录，通过 COPY 分批写入
+def seed_volume(cur, medicines=0, sales=0, users=0, days=30):
+    if users:
+        password_hash = generate_password_hash('staff123')
+        for batch in batched((f'staff_{i:06d}', password_hash, 'salesperson') for i in range(users)):
+            copy_rows(cur, 'users', ('username', 'password_hash', 'role'), batch)
+        print(f'已生成 {users} 个销售人员（密码 staff123）')
+
+    if medicines:
+        def medicine_rows():
+            for i in range(medicines):
+                name = ''.join(random.choice(NAME_CHARS) for _ in range(random.randint(2, 5)))
+                yield (f'{name}{random.choice(FORMS)}{i}', f'{random.randint(1, 500)}mg*{random.randint(6, 48)}/盒',
+                       random.choice(MANUFACTURERS), f'{random.uniform(1, 300):.2f}', VOLUME_STOCK)
+        for batch in batched(medicine_rows()):
+            copy_rows(cur, 'medicines', ('name', 'description', 'manufacturer', 'price', 'stock'), batch)
+        print(f'已生成 {medicines} 种药品')
+
+    if sales:
+        # 只在压测药品上生成销售，示例药品库存较少
+        cur.execute("SELECT id, price FROM medicines WHERE stock >= %s", (VOLUME_STOCK,))
+        catalogue = cur.fetchall()
+        if not catalogue:
+            raise ValueError('生成销售记录需要同时指定 --medicines')
+        cur.execute("SELECT id FROM users")
+        salespeople = [row[0] for row in cur.fetchall()]
+        now = datetime.now()
+        span = days * 86400
+        def sale_rows():
+            for _ in range(sales):
+                medicine_id, price = random.choice(catalogue)
+                quantity = random.randint(1, 5)
+                created_at = now - timedelta(seconds=random.randint(0, span))
+                yield (medicine_id, random.choice(salespeople), quantity, price * quantity, created_at.isoformat(' '))
+        for i, batch in enumerate(batched(sale_rows()), start=1):
+            copy_rows(cur, 'sales_records', ('medicine_id', 'salesperson_id', 'quantity', 'total_price', 'created_at'), batch)
+            print(f'已生成 {min(i * COPY_BATCH, sales)}/{sales} 条销售记录')
+
+def init_database(medicines=0, sales=0, users=0, days=30, lots=3):
+    conn = pool.getconn()
+    migrate(conn)
     cur = conn.cursor()
     
     try:
         # 清空现有数据
+        cur.execute("DELETE FROM sales_daily_rollup")
         cur.execute("DELETE FROM sales_records")
+        cur.execute("DELETE FROM sale_lot_allocations")
+        cur.execute("DELETE FROM sales_archive")
+        # 分区表上先建好覆盖生成数据时间范围的分区，避免记录落入默认分区
+        ensure_partitions(cur, PARTITION_MONTHS_AHEAD, datetime.now() - timedelta(days=max(days, 30)))
         cur.execute("DELETE FROM medicines")
         cur.execute("DELETE FROM users")
         
@@ -27,10 +110,12 @@ def init_database():
         cur.execute("""
             INSERT INTO users (username, password_hash, role)
             VALUES (%s, %s, %s)
+            RETURNING id
         """, ('admin', admin_password, 'admin'))
+        admin_id = cur.fetchone()[0]
         
         # 创建示例药品
-        medicines = [
+        sample_medicines = [
             ('阿莫西林胶囊', '0.25g*24粒/盒', '哈药集团制药总厂', 15.8, 100),
             ('布洛芬片', '0.2g*24片/盒', '上海信谊药厂', 12.5, 150),
             ('感冒灵颗粒', '10g*10袋/盒', '白云山制药', 25.0, 80),
@@ -43,32 +128,50 @@ def init_database():
             ('金银花露', '10ml*10支/盒', '哈药集团', 12.0, 200)
         ]
         
-        for medicine in medicines:
-            cur.execute("""
-                INSERT INTO medicines (name, specification, manufacturer, price, stock)
-                VALUES (%s, %s, %s, %s, %s)
-            """, medicine)
+        # 批量写入药品，RETURNING 的 id 与 VALUES 顺序一致
+        medicine_ids = [row[0] for row in execute_values(cur, """
+            INSERT INTO medicines (name, description, manufacturer, price, stock)
+            VALUES %s
+            RETURNING id
+        """, sample_medicines, fetch=True)]
         
         # 创建一些示例销售记录
-        admin_id = 1  # 假设管理员ID为1
+        sample_sales = []
         for i in range(20):  # 创建20条销售记录
-            medicine_id = random.randint(1, len(medicines))
+            index = random.randrange(len(sample_medicines))
             quantity = random.randint(1, 5)
-            price = medicines[medicine_id-1][3]
-            total_price = price * quantity
+            total_price = sample_medicines[index][3] * quantity
             created_at = datetime.now() - timedelta(days=random.randint(0, 30))
-            
-            cur.execute("""
-                INSERT INTO sales_records (medicine_id, salesperson_id, quantity, total_price, created_at)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (medicine_id, admin_id, quantity, total_price, created_at))
-            
-            # 更新药品库存
-            cur.execute("""
-                UPDATE medicines 
-                SET stock = stock - %s 
-                WHERE id = %s
-            """, (quantity, medicine_id))
+            sample_sales.append((medicine_ids[index], admin_id, quantity, total_price, created_at))
+        execute_values(cur, """
+            INSERT INTO sales_records (medicine_id, salesperson_id, quantity, total_price, created_at)
+            VALUES %s
+        """, sample_sales)
+        
+        # 压测数据量
+        seed_volume(cur, medicines=medicines, sales=sales, users=users, days=days)
+        
+        # 一次性扣减库存
+        cur.execute("""
+            UPDATE medicines m
+            SET stock = m.stock - s.quantity
+            FROM (
+                SELECT medicine_id, SUM(quantity) AS quantity
+                FROM sales_records
+                GROUP BY medicine_id
+            ) s
+            WHERE m.id = s.medicine_id
+        """)
+        # 扣减后的库存按批次登记（示例销售不记录扣减的批次）
+        print(f'已生成 {seed_lots(cur, lots)} 个药品批次')
+        
+        # 重建按天汇总
+        cur.execute("""
+            INSERT INTO sales_daily_rollup (day, medicine_id, salesperson_id, sale_count, quantity, revenue)
+            SELECT created_at::date, medicine_id, COALESCE(salesperson_id, 0), COUNT(*), SUM(quantity), SUM(total_price)
+            FROM sales_records
+            GROUP BY 1, 2, 3
+        """)
         
         conn.commit()
         print("数据库初始化成功！")
@@ -78,7 +181,17 @@ def init_database():
         print(f"数据库初始化失败: {str(e)}")
     finally:
         cur.close()
-        conn.close()
+        pool.putconn(conn)
+        pool.close()
 
 if __name__ == '__main__':
-    init_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='初始化数据库并生成示例数据')
+    parser.add_argument('--medicines', type=int, default=0, help='额外生成的药品数量')
+    parser.add_argument('--sales', type=int, default=0, help='额外生成的销售记录数量')
+    parser.add_argument('--users', type=int, default=0, help='额外生成的销售人员数量')
+    parser.add_argument('--days', type=int, default=30, help='销售记录分布的天数')
+    parser.add_argument('--lots', type=int, default=3, help='每种药品的批次数量')
+    parser.add_argument('--seed', type=int, default=None, help='随机数种子，便于生成可复现的数据')
+    args = parser.parse_args()
+    random.seed(args.seed)
+    init_database(medicines=args.medicines, sales=args.sales, users=args.users, days=args.days, lots=args.lots) 
\ No newline at end of file
@@ -0,0 +1,173 @@
+import logging
+import math
+import queue
+import threading
+import time
+
+log = logging.getLogger('pharmacy.inventory')
+
+# 计算销售速度的两个窗口（天）
+SHORT_WINDOW_DAYS = 7
+LONG_WINDOW_DAYS = 28
+
+
+# 库存预警和补货建议
+# 销售接口提交后只把销售事件放入进程内队列（队列满时丢弃并计数），不增加收银延迟；
+# 后台线程消费事件，维护每个药品的当前库存和近期销量。每 refresh_interval 秒（或药品目录
+# 被修改后）从数据库重新加载库存和近 28 天的按天汇总，计算 7 天 / 28 天日均销量：
+#   销售速度 = max(7 天日均, 28 天日均)，需求上升时按较快的速度备货
+#   补货点   = ceil(销售速度 × (到货天数 + 安全天数))，且不低于 low_stock
+#   建议补货 = ceil(销售速度 × (到货天数 + 覆盖天数)) - 当前库存
+# 库存降到补货点及以下的药品出现在补货建议中，销售使库存跌破补货点时写一条预警日志。
+class InventoryMonitor:
+    def __init__(self, lead_time_days=3, safety_days=2, cover_days=14, low_stock=10,
+                 refresh_interval=300.0, queue_size=10000):
+        self.lead_time_days = lead_time_days
+        self.safety_days = safety_days
+        self.cover_days = cover_days
+        self.low_stock = low_stock
+        self.refresh_interval = refresh_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._refresh = threading.Event()
+        self._pool = None
+        self._loaded_at = None
+        # medicine_id -> [名称, 厂家, 库存, 7 天销量, 28 天销量]
+        self._medicines = {}
+        self._stats = {'events': 0, 'dropped': 0, 'alerts': 0, 'refreshes': 0, 'refresh_errors': 0,
+                       'refresh_seconds_last': 0.0}
+
+    # 线程启动开销很小，可以在请求中调用；首次加载在后台线程中进行
+    def ensure_started(self, pool):
+        with self._lock:
+            if self._pool is not None:
+                return
+            self._pool = pool
+        threading.Thread(target=self._run, name='inventory-monitor', daemon=True).start()
+
+    # 销售提交后调用：stock 为提交后的库存，quantity 为售出数量（删除销售时为负数，入库等只改变库存时为 0）
+    def publish(self, medicine_id, quantity, stock):
+        try:
+            self._queue.put_nowait((time.time(), medicine_id, quantity, stock))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+
+    # 药品增删改后调用，后台线程尽快重新加载
+    def request_refresh(self):
+        self._refresh.set()
+        self.publish(None, 0, None)
+
+    def _run(self):
+        next_refresh = 0.0
+        while True:
+            if self._refresh.is_set() or time.monotonic() >= next_refresh:
+                self._refresh.clear()
+                try:
+                    self._load()
+                except Exception:
+                    with self._lock:
+                        self._stats['refresh_errors'] += 1
+                    log.exception('加载库存和销量数据失败')
+                next_refresh = time.monotonic() + self.refresh_interval
+            try:
+                event = self._queue.get(timeout=max(0.0, next_refresh - time.monotonic()))
+            except queue.Empty:
+                continue
+            self._apply(event)
+
+    def _load(self):
+        started = time.monotonic()
+        loaded_at = time.time()
+        with self._pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT m.id, m.name, m.manufacturer, m.stock,
+                       COALESCE(r.short_quantity, 0)::bigint, COALESCE(r.long_quantity, 0)::bigint
+                FROM medicines m
+                LEFT JOIN (
+                    SELECT medicine_id,
+                           SUM(quantity) FILTER (WHERE day > current_date - %s) AS short_quantity,
+                           SUM(quantity) AS long_quantity
+                    FROM sales_daily_rollup
+                    WHERE day > current_date - %s
+                    GROUP BY medicine_id
+                ) r ON r.medicine_id = m.id
+            """, (SHORT_WINDOW_DAYS, LONG_WINDOW_DAYS))
+            medicines = {row[0]: list(row[1:]) for row in cur.fetchall()}
+            conn.commit()
+            cur.close()
+        with self._lock:
+            self._medicines = medicines
+            self._loaded_at = loaded_at
+            self._stats['refreshes'] += 1
+            self._stats['refresh_seconds_last'] = round(time.monotonic() - started, 4)
+        self._ready.set()
+
+    def _apply(self, event):
+        at, medicine_id, quantity, stock = event
+        if medicine_id is None:
+            return
+        with self._lock:
+            self._stats['events'] += 1
+            entry = self._medicines.get(medicine_id)
+            # 加载之前发生的销售已经包含在加载的数据中
+            if entry is None or self._loaded_at is None or at < self._loaded_at:
+                return
+            before = entry[2]
+            entry[2] = stock
+            entry[3] += quantity
+            entry[4] += quantity
+            reorder_point = self._reorder_point(entry)
+            crossed = before > reorder_point >= stock
+            if crossed:
+                self._stats['alerts'] += 1
+        if crossed:
+            log.warning('库存预警：药品 %s（%s）库存 %s，补货点 %s', medicine_id, entry[0], stock, reorder_point)
+
+    def _velocity(self, entry):
+        return max(entry[3] / SHORT_WINDOW_DAYS, entry[4] / LONG_WINDOW_DAYS)
+
+    def _reorder_point(self, entry):
+        velocity = self._velocity(entry)
+        return max(self.low_stock, math.ceil(velocity * (self.lead_time_days + self.safety_days)))
+
+    # 等待首次加载完成，返回是否已就绪
+    def wait_ready(self, timeout):
+        return self._ready.wait(timeout)
+
+    # 库存降到补货点及以下的药品，已缺货的在前，其余按可售天数从少到多排列
+    def suggestions(self, limit=50):
+        items = []
+        with self._lock:
+            for medicine_id, entry in self._medicines.items():
+                reorder_point = self._reorder_point(entry)
+                stock = entry[2]
+                if stock > reorder_point:
+                    continue
+                velocity = self._velocity(entry)
+                target = max(reorder_point, math.ceil(velocity * (self.lead_time_days + self.cover_days)))
+                items.append({
+                    'medicine_id': medicine_id,
+                    'name': entry[0],
+                    'manufacturer': entry[1],
+                    'stock': stock,
+                    'status': 'out_of_stock' if stock <= 0 else 'reorder',
+                    'velocity_7d': round(entry[3] / SHORT_WINDOW_DAYS, 2),
+                    'velocity_28d': round(entry[4] / LONG_WINDOW_DAYS, 2),
+                    'reorder_point': reorder_point,
+                    'days_of_cover': round(stock / velocity, 1) if velocity > 0 else None,
+                    'suggested_quantity': max(0, target - stock)
+                })
+        items.sort(key=lambda item: (item['stock'] > 0,
+                                     item['days_of_cover'] if item['days_of_cover'] is not None else math.inf,
+                                     item['stock']))
+        return items[:limit]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['medicines'] = len(self._medicines)
+            stats['queue'] = self._queue.qsize()
+        return stats
@@ -0,0 +1,155 @@
+# 药品批次（批号、有效期、数量）
+#
+# medicines.stock 是各批次数量之和，读取库存仍只需读药品表一行。所有修改批次的操作都先锁定
+# （UPDATE 或 SELECT ... FOR UPDATE）对应的药品行，再用新的语句读写批次：READ COMMITTED 下
+# 后一条语句的快照包含之前持有该行锁的事务的全部修改，同一药品的批次不会被重复分配。
+# 销售按有效期从早到晚（FEFO）扣减，已过期的批次不参与销售；未填写有效期的批次排在最后。
+
+# 迁移前已有的库存、直接修改 stock（编辑药品、批量导入）增加的库存和批次信息已缺失的退货
+# 记在每种药品一个的“未分批”批次中，有效期为空
+UNTRACKED_LOT = '未分批'
+
+
+class LotError(ValueError):
+    pass
+
+
+# 未过期批次的可销售数量不足（库存中包含已过期批次）
+class LotShortage(Exception):
+    def __init__(self, medicine_ids):
+        super().__init__('可销售库存不足（部分批次已过期）')
+        self.medicine_ids = medicine_ids
+
+
+# 按 FEFO 为一组销售分配批次，参数为销售记录 ID、药品 ID、数量三个等长数组，
+# 返回 (销售记录 ID, 批次 ID, 数量)。一条语句完成：同一药品的各笔销售按 ID 顺序排成连续的
+# 需求区间，未过期批次按有效期排成连续的库存区间，两者的重叠部分即为分配量，
+# 随后扣减批次数量并写入 sale_lot_allocations
+ALLOCATE_SQL = """
+    WITH demand AS (
+        SELECT d.sale_id, d.medicine_id, d.quantity,
+               SUM(d.quantity) OVER (PARTITION BY d.medicine_id ORDER BY d.sale_id) AS demand_end
+        FROM unnest(%s::int[], %s::int[], %s::int[]) AS d(sale_id, medicine_id, quantity)
+    ), lots AS (
+        SELECT l.id, l.medicine_id, l.quantity,
+               SUM(l.quantity) OVER (PARTITION BY l.medicine_id ORDER BY l.expiry_date NULLS LAST, l.id) AS lot_end
+        FROM medicine_lots l
+        WHERE l.medicine_id IN (SELECT medicine_id FROM demand) AND l.quantity > 0
+          AND (l.expiry_date IS NULL OR l.expiry_date >= CURRENT_DATE)
+    ), picks AS (
+        SELECT d.sale_id, l.id AS lot_id,
+               LEAST(d.demand_end, l.lot_end) - GREATEST(d.demand_end - d.quantity, l.lot_end - l.quantity) AS quantity
+        FROM demand d
+        JOIN lots l ON l.medicine_id = d.medicine_id
+         AND l.lot_end - l.quantity < d.demand_end AND d.demand_end - d.quantity < l.lot_end
+    ), consumed AS (
+        UPDATE medicine_lots l
+        SET quantity = l.quantity - p.quantity
+        FROM (SELECT lot_id, SUM(quantity) AS quantity FROM picks GROUP BY lot_id) p
+        WHERE l.id = p.lot_id
+    )
+    INSERT INTO sale_lot_allocations (sale_id, lot_id, quantity)
+    SELECT sale_id, lot_id, quantity FROM picks
+    RETURNING sale_id, lot_id, quantity
+"""
+
+
+def allocation_params(sales):
+    return ([s[0] for s in sales], [s[1] for s in sales], [s[2] for s in sales])
+
+
+# 分配结果不足销售数量的药品 ID；sales 为 [(销售记录 ID, 药品 ID, 数量)]
+def shortages(sales, allocations):
+    allocated = {}
+    for sale_id, _, quantity in allocations:
+        allocated[sale_id] = allocated.get(sale_id, 0) + quantity
+    return sorted({medicine_id for sale_id, medicine_id, quantity in sales
+                   if allocated.get(sale_id, 0) < quantity})
+
+
+# 调用前需已锁定并扣减了相关药品的库存
+def allocate_lots(cur, sales):
+    cur.execute(ALLOCATE_SQL, allocation_params(sales))
+    allocations = cur.fetchall()
+    short = shortages(sales, allocations)
+    if short:
+        raise LotShortage(short)
+    return allocations
+
+
+def add_untracked(cur, medicine_id, quantity):
+    cur.execute("""
+        INSERT INTO medicine_lots AS l (medicine_id, lot_number, quantity)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (medicine_id, lot_number) DO UPDATE SET quantity = l.quantity + EXCLUDED.quantity
+    """, (medicine_id, UNTRACKED_LOT, quantity))
+
+
+# 删除销售记录时把数量退回原批次；早于批次管理的销售没有分配记录，退回未分批库存
+def release_lots(cur, sale_id, medicine_id, quantity):
+    cur.execute("""
+        WITH released AS (
+            DELETE FROM sale_lot_allocations WHERE sale_id = %s
+            RETURNING lot_id, quantity
+        )
+        UPDATE medicine_lots l
+        SET quantity = l.quantity + r.quantity
+        FROM released r
+        WHERE l.id = r.lot_id
+        RETURNING r.quantity
+    """, (sale_id,))
+    remaining = quantity - sum(row[0] for row in cur.fetchall())
+    if remaining > 0:
+        add_untracked(cur, medicine_id, remaining)
+
+
+# 直接修改 medicines.stock 之后调用，使批次合计与库存一致：增加的部分计入未分批库存，
+# 减少的部分视为盘点调整，先扣未分批库存，再按有效期从早到晚扣减（包括已过期批次）
+def sync_lots(cur, medicine_ids):
+    cur.execute("""
+        WITH diff AS (
+            SELECT m.id AS medicine_id, m.stock - COALESCE(SUM(l.quantity), 0) AS delta
+            FROM medicines m
+            LEFT JOIN medicine_lots l ON l.medicine_id = m.id
+            WHERE m.id = ANY(%s)
+            GROUP BY m.id
+        ), added AS (
+            INSERT INTO medicine_lots AS l (medicine_id, lot_number, quantity)
+            SELECT medicine_id, %s, delta FROM diff WHERE delta > 0
+            ON CONFLICT (medicine_id, lot_number) DO UPDATE SET quantity = l.quantity + EXCLUDED.quantity
+        ), lots AS (
+            SELECT l.id, l.quantity, -d.delta AS deficit,
+                   SUM(l.quantity) OVER (PARTITION BY l.medicine_id ORDER BY l.expiry_date NULLS FIRST, l.id) AS lot_end
+            FROM medicine_lots l
+            JOIN diff d ON d.medicine_id = l.medicine_id AND d.delta < 0
+            WHERE l.quantity > 0
+        )
+        UPDATE medicine_lots l
+        SET quantity = l.quantity - LEAST(s.quantity, s.deficit - (s.lot_end - s.quantity))
+        FROM lots s
+        WHERE l.id = s.id AND s.lot_end - s.quantity < s.deficit
+    """, (list(medicine_ids), UNTRACKED_LOT))
+
+
+# 入库一个批次，同一批号再次入库时累加数量（有效期必须相同）。返回 (批次 ID, 批次数量, 药品库存)，
+# 药品不存在时返回 None
+def receive_lot(cur, medicine_id, lot_number, expiry_date, quantity):
+    cur.execute("""
+        UPDATE medicines SET stock = stock + %s, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+        RETURNING stock
+    """, (quantity, medicine_id))
+    medicine = cur.fetchone()
+    if medicine is None:
+        return None
+    cur.execute("""
+        INSERT INTO medicine_lots AS l (medicine_id, lot_number, expiry_date, quantity)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (medicine_id, lot_number) DO UPDATE SET quantity = l.quantity + EXCLUDED.quantity
+        WHERE l.expiry_date IS NOT DISTINCT FROM EXCLUDED.expiry_date
+        RETURNING id, quantity
+    """, (medicine_id, lot_number, expiry_date, quantity))
+    lot = cur.fetchone()
+    if lot is None:
+        raise LotError('该批号已存在且有效期不同')
+    return lot[0], lot[1], medicine[0]
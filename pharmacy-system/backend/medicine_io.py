@@ -0,0 +1,110 @@
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+# 导入导出使用的列，导出文件可以直接再导入
+MEDICINE_COLUMNS = ('name', 'description', 'manufacturer', 'price', 'stock')
+
+# 供应商表格常用的中文表头
+COLUMN_ALIASES = {
+    '名称': 'name', '药品名称': 'name',
+    '规格': 'description', '描述': 'description', 'specification': 'description',
+    '生产厂家': 'manufacturer', '厂家': 'manufacturer',
+    '价格': 'price', '单价': 'price',
+    '库存': 'stock', '数量': 'stock',
+}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def _header(values):
+    columns = []
+    for value in values:
+        name = str(value or '').strip()
+        columns.append(COLUMN_ALIASES.get(name, name.lower()))
+    missing = [c for c in MEDICINE_COLUMNS if c not in columns]
+    if missing:
+        raise ImportFormatError(f'缺少列: {", ".join(missing)}')
+    return columns
+
+
+def _csv_rows(stream):
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    header = next(reader, None)
+    if header is None:
+        raise ImportFormatError('文件为空')
+    return _header(header), reader
+
+
+def _xlsx_rows(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError('导入 Excel 文件需要安装 openpyxl')
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFormatError('文件为空')
+    return _header(header), rows
+
+
+# 逐行读取上传文件，返回 (行号, 原始字段字典)，行号从表头之后的第一行记为 2
+def read_rows(file_storage):
+    filename = (file_storage.filename or '').lower()
+    if filename.endswith('.xlsx'):
+        columns, rows = _xlsx_rows(file_storage.stream)
+    elif filename.endswith('.csv') or not filename:
+        columns, rows = _csv_rows(file_storage.stream)
+    else:
+        raise ImportFormatError('只支持 CSV 或 XLSX 文件')
+    for line, values in enumerate(rows, start=2):
+        if not any(v not in (None, '') for v in values):
+            continue
+        yield line, dict(zip(columns, values))
+
+
+# 校验并转换一行，返回 (name, description, manufacturer, price, stock)，出错时抛出 ValueError
+def validate_row(raw):
+    row = {}
+    for column in ('name', 'description', 'manufacturer'):
+        value = str(raw.get(column) or '').strip()
+        if not value:
+            raise ValueError(f'{column} 不能为空')
+        if len(value) > 100:
+            raise ValueError(f'{column} 超过 100 个字符')
+        row[column] = value
+    try:
+        price = Decimal(str(raw.get('price')).strip())
+    except InvalidOperation:
+        raise ValueError('price 必须是数字')
+    if not price.is_finite() or price < 0 or price >= Decimal('100000000'):
+        raise ValueError('price 超出范围')
+    try:
+        stock = Decimal(str(raw.get('stock')).strip())
+    except InvalidOperation:
+        raise ValueError('stock 必须是整数')
+    # NaN、Infinity 也能解析为 Decimal，比较时会抛出 InvalidOperation，必须先排除
+    try:
+        if not stock.is_finite() or stock != stock.to_integral_value() or stock < 0 or stock > 2147483647:
+            raise ValueError('stock 必须是非负整数')
+    except InvalidOperation:
+        raise ImportFormatError('stock 必须是非负整数')
+    return row['name'], row['description'], row['manufacturer'], price.quantize(Decimal('0.01')), int(stock)
+
+
+# 将一批校验通过的行写成 COPY ... FROM STDIN (FORMAT csv) 的输入
+def copy_buffer(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+def csv_chunk(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
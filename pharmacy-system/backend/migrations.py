@@ -0,0 +1,396 @@
+import logging
+
+import psycopg2
+
+from lots import UNTRACKED_LOT
+from partitions import DEFAULT_PARTITION, ensure_partitions, is_partitioned
+
+log = logging.getLogger('pharmacy.migrations')
+
+# pg_advisory_lock 的锁号，多个进程同时启动时只有一个执行迁移
+MIGRATION_LOCK_ID = 7270013
+
+
+def _column_exists(cur, table, column):
+    cur.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = %s AND column_name = %s
+    """, (table, column))
+    return cur.fetchone() is not None
+
+
+def _constraint_exists(cur, name):
+    cur.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (name,))
+    return cur.fetchone() is not None
+
+
+# 早期按 models.py 建的库中规格列名为 specification，统一改为 description
+def rename_specification(cur):
+    if _column_exists(cur, 'medicines', 'specification') and not _column_exists(cur, 'medicines', 'description'):
+        cur.execute("ALTER TABLE medicines RENAME COLUMN specification TO description")
+
+
+# 已有重复数据时无法建立唯一索引，只给出提示，批量导入将不可用
+def create_sku_index(cur):
+    cur.execute("SAVEPOINT medicine_sku")
+    try:
+        cur.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_medicines_sku
+            ON medicines (name, manufacturer, description)
+        """)
+        cur.execute("RELEASE SAVEPOINT medicine_sku")
+    except psycopg2.IntegrityError:
+        cur.execute("ROLLBACK TO SAVEPOINT medicine_sku")
+        log.warning('药品表存在名称、厂家、规格完全相同的重复数据，批量导入将不可用')
+
+
+# 新写入的数据立即受约束检查；已有数据违反约束时保留 NOT VALID 状态并给出提示，
+# 修正数据后执行 ALTER TABLE ... VALIDATE CONSTRAINT 即可
+def add_check(table, name, expression):
+    def step(cur):
+        if _constraint_exists(cur, name):
+            return
+        cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} CHECK ({expression}) NOT VALID")
+        cur.execute("SAVEPOINT validate_check")
+        try:
+            cur.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+            cur.execute("RELEASE SAVEPOINT validate_check")
+        except psycopg2.IntegrityError:
+            cur.execute("ROLLBACK TO SAVEPOINT validate_check")
+            log.warning('%s 中已有数据不满足 %s，约束只对新数据生效', table, name)
+    return step
+
+
+# 迁移时创建到几个月之后的分区，之后由分区维护线程补齐
+PARTITION_MONTHS_AHEAD = 3
+
+
+# 把 sales_records 改为按 created_at 按月分区的表：新建分区表并复制数据后替换原表，
+# 自增序列、外键、约束和索引保持不变。分区表的主键必须包含分区键，主键改为 (id, created_at)，
+# created_at 改为 NOT NULL（原有为空的记录按 1970-01-01 写入默认分区）。
+# 复制期间销售表不可用，数据量大时请在停机维护时执行。
+# 声明式分区需要 PostgreSQL 11 及以上，openGauss 等不支持时保持原表结构
+def partition_sales_records(cur):
+    cur.execute("SHOW server_version_num")
+    if int(cur.fetchone()[0]) < 110000:
+        log.warning('数据库不支持声明式分区，sales_records 保持不分区')
+        return
+    if is_partitioned(cur):
+        return
+    cur.execute("SELECT pg_get_serial_sequence('sales_records', 'id'), MIN(created_at) FROM sales_records")
+    sequence, first_sale = cur.fetchone()
+    cur.execute("ALTER TABLE sales_records RENAME TO sales_records_unpartitioned")
+    cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    cur.execute(f"""
+        CREATE TABLE sales_records (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'::regclass),
+            medicine_id INTEGER REFERENCES medicines(id),
+            salesperson_id INTEGER REFERENCES users(id),
+            quantity INTEGER NOT NULL,
+            total_price NUMERIC(10,2) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) PARTITION BY RANGE (created_at)
+    """)
+    cur.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF sales_records DEFAULT")
+    ensure_partitions(cur, PARTITION_MONTHS_AHEAD, first_sale)
+    cur.execute("""
+        INSERT INTO sales_records (id, medicine_id, salesperson_id, quantity, total_price, created_at)
+        SELECT id, medicine_id, salesperson_id, quantity, total_price, COALESCE(created_at, 'epoch')
+        FROM sales_records_unpartitioned
+    """)
+    cur.execute("DROP TABLE sales_records_unpartitioned")
+    cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY sales_records.id")
+    cur.execute("ALTER TABLE sales_records ADD CONSTRAINT sales_records_pkey PRIMARY KEY (id, created_at)")
+    # 在父表上建索引，每个分区（包括以后创建的分区）自动建立对应的索引
+    cur.execute("CREATE INDEX idx_sales_created_id ON sales_records (created_at DESC, id DESC)")
+    cur.execute("CREATE INDEX idx_sales_medicine_created ON sales_records (medicine_id, created_at DESC, id DESC)")
+    cur.execute("CREATE INDEX idx_sales_salesperson_created ON sales_records (salesperson_id, created_at DESC, id DESC)")
+    add_check('sales_records', 'ck_sales_quantity_positive', 'quantity > 0')(cur)
+    add_check('sales_records', 'ck_sales_total_price_nonnegative', 'total_price >= 0')(cur)
+    cur.execute("ANALYZE sales_records")
+
+
+
+# 已有库存记为每种药品一个未分批的批次，之后的入库再按批号和有效期登记
+def backfill_lots(cur):
+    cur.execute("""
+        INSERT INTO medicine_lots (medicine_id, lot_number, quantity)
+        SELECT id, %s, stock FROM medicines WHERE stock > 0
+        ON CONFLICT (medicine_id, lot_number) DO NOTHING
+    """, (UNTRACKED_LOT,))
+
+
+# 迁移列表：(版本号, 说明, 步骤)，步骤是 SQL 语句或接收游标的函数。
+# 已发布的迁移不要修改，新的变更追加到末尾。
+MIGRATIONS = [
+    (1, '初始表结构', [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(80) UNIQUE NOT NULL,
+            password_hash VARCHAR(120) NOT NULL,
+            role VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS medicines (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            description VARCHAR(100) NOT NULL,
+            price NUMERIC(10,2) NOT NULL,
+            stock INTEGER NOT NULL,
+            manufacturer VARCHAR(100) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        rename_specification,
+        """
+        CREATE TABLE IF NOT EXISTS sales_records (
+            id SERIAL PRIMARY KEY,
+            medicine_id INTEGER REFERENCES medicines(id),
+            salesperson_id INTEGER REFERENCES users(id),
+            quantity INTEGER NOT NULL,
+            total_price NUMERIC(10,2) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    # 外键列和时间列的索引：删除药品/用户时检查销售记录、按药品/销售人员/时间筛选销售记录
+    # 以及药品和销售记录的分页都依赖这些索引
+    (2, '分页和筛选索引', [
+        """
+        CREATE INDEX IF NOT EXISTS idx_medicines_created_id
+        ON medicines (created_at DESC, id DESC) INCLUDE (name, manufacturer, price, stock)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_medicines_name_prefix
+        ON medicines (name varchar_pattern_ops)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_medicines_manufacturer
+        ON medicines (manufacturer, created_at DESC, id DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_sales_created_id
+        ON sales_records (created_at DESC, id DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_sales_medicine_created
+        ON sales_records (medicine_id, created_at DESC, id DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_sales_salesperson_created
+        ON sales_records (salesperson_id, created_at DESC, id DESC)
+        """,
+    ]),
+    (3, '药品唯一索引', [create_sku_index]),
+    # catalogue_version_seq：药品或库存变化后递增，用于多进程间的目录缓存失效
+    # medicine_search_version_seq：名称、厂家、描述变化后递增，用于重建搜索索引
+    (4, '目录版本号', [
+        "CREATE SEQUENCE IF NOT EXISTS catalogue_version_seq",
+        "CREATE SEQUENCE IF NOT EXISTS medicine_search_version_seq",
+    ]),
+    # 按天汇总的销售统计，由销售接口增量维护；销售人员为空时记为 0。创建时从历史销售记录回填
+    (5, '销售按天汇总', [
+        """
+        CREATE TABLE IF NOT EXISTS sales_daily_rollup (
+            day DATE NOT NULL,
+            medicine_id INTEGER NOT NULL,
+            salesperson_id INTEGER NOT NULL,
+            sale_count INTEGER NOT NULL,
+            quantity BIGINT NOT NULL,
+            revenue NUMERIC(14,2) NOT NULL,
+            PRIMARY KEY (day, medicine_id, salesperson_id)
+        )
+        """,
+        """
+        INSERT INTO sales_daily_rollup (day, medicine_id, salesperson_id, sale_count, quantity, revenue)
+        SELECT created_at::date, medicine_id, COALESCE(salesperson_id, 0), COUNT(*), SUM(quantity), SUM(total_price)
+        FROM sales_records
+        WHERE created_at IS NOT NULL AND NOT EXISTS (SELECT 1 FROM sales_daily_rollup)
+        GROUP BY 1, 2, 3
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    (6, '库存、价格和销售数量约束', [
+        add_check('medicines', 'ck_medicines_stock_nonnegative', 'stock >= 0'),
+        add_check('medicines', 'ck_medicines_price_nonnegative', 'price >= 0'),
+        add_check('sales_records', 'ck_sales_quantity_positive', 'quantity > 0'),
+        add_check('sales_records', 'ck_sales_total_price_nonnegative', 'total_price >= 0'),
+    ]),
+    # pbkdf2:sha512 等算法的哈希超过 120 个字符
+    (7, '加长密码哈希列', [
+        "ALTER TABLE users ALTER COLUMN password_hash TYPE VARCHAR(255)",
+    ]),
+    # 已吊销的令牌：jti 不为空时吊销单个令牌，否则吊销 user_id 在 revoked_at 之前签发的全部令牌。
+    # 过期的记录由各进程同步名单时删除
+    (8, '令牌吊销名单', [
+        """
+        CREATE TABLE IF NOT EXISTS token_blocklist (
+            id BIGSERIAL PRIMARY KEY,
+            jti VARCHAR(64),
+            user_id INTEGER,
+            revoked_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            expires_at TIMESTAMPTZ NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_token_blocklist_revoked_at ON token_blocklist (revoked_at)",
+        "CREATE INDEX IF NOT EXISTS idx_token_blocklist_expires_at ON token_blocklist (expires_at)",
+    ]),
+    # 销售记录按月分区；冷数据归档到压缩的 CSV 文件后登记在 sales_archive 中（见 partitions.py）。
+    # 归档的销售记录只保留在按天汇总中，删除药品/用户时还要检查汇总表
+    (9, '销售记录按月分区和归档', [
+        partition_sales_records,
+        """
+        CREATE TABLE IF NOT EXISTS sales_archive (
+            month DATE PRIMARY KEY,
+            filename VARCHAR(200) NOT NULL,
+            sale_count BIGINT NOT NULL,
+            quantity BIGINT NOT NULL,
+            revenue NUMERIC(14,2) NOT NULL,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_sales_rollup_medicine ON sales_daily_rollup (medicine_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_rollup_salesperson ON sales_daily_rollup (salesperson_id)",
+    ]),
+    # 药品批次（见 lots.py），medicines.stock 为各批次数量之和。只有数量大于 0 的批次进入索引：
+    # idx_medicine_lots_fefo 用于销售时按有效期分配，idx_medicine_lots_expiry 用于近效期报表。
+    # sale_lot_allocations 记录每笔销售扣减的批次，删除销售记录时退回；
+    # 分区表的主键为 (id, created_at)，不能只按销售记录 ID 建外键
+    (10, '药品批次和有效期', [
+        """
+        CREATE TABLE IF NOT EXISTS medicine_lots (
+            id SERIAL PRIMARY KEY,
+            medicine_id INTEGER NOT NULL REFERENCES medicines(id) ON DELETE CASCADE,
+            lot_number VARCHAR(50) NOT NULL,
+            expiry_date DATE,
+            quantity INTEGER NOT NULL,
+            received_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT uq_medicine_lots_number UNIQUE (medicine_id, lot_number),
+            CONSTRAINT ck_medicine_lots_quantity_nonnegative CHECK (quantity >= 0)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_medicine_lots_fefo
+        ON medicine_lots (medicine_id, expiry_date, id) WHERE quantity > 0
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_medicine_lots_expiry
+        ON medicine_lots (expiry_date, id) INCLUDE (medicine_id, lot_number, quantity)
+        WHERE quantity > 0 AND expiry_date IS NOT NULL
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sale_lot_allocations (
+            sale_id INTEGER NOT NULL,
+            lot_id INTEGER NOT NULL REFERENCES medicine_lots(id) ON DELETE CASCADE,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (sale_id, lot_id),
+            CONSTRAINT ck_sale_lot_allocations_quantity_positive CHECK (quantity > 0)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_sale_lot_allocations_lot ON sale_lot_allocations (lot_id)",
+        backfill_lots,
+    ]),
+    # 销售接口的幂等键（见 idempotency.py）：key 为用户 ID 和客户端键的摘要，status 和 response
+    # 在业务事务提交前写入。过期的记录由后台线程按 expires_at 分批删除
+    (11, '幂等键', [
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key BYTEA PRIMARY KEY,
+            fingerprint BYTEA NOT NULL,
+            status SMALLINT,
+            response BYTEA,
+            expires_at TIMESTAMPTZ NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys (expires_at)",
+    ]),
+    # 停用用户代替删除：disabled_at 不为空的用户不能登录，销售记录保持关联，删除前不再检查销售记录。
+    # 用户列表按 (created_at, id) 倒序分页、按用户名前缀筛选；
+    # user_directory_version_seq 在用户增加、停用、启用后递增，用于多进程间的用户列表缓存失效
+    (12, '用户停用和用户列表', [
+        "UPDATE users SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL",
+        "ALTER TABLE users ALTER COLUMN created_at SET NOT NULL",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS disabled_at TIMESTAMP",
+        "CREATE INDEX IF NOT EXISTS idx_users_created_id ON users (created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_users_username_prefix ON users (username varchar_pattern_ops)",
+        "CREATE SEQUENCE IF NOT EXISTS user_directory_version_seq",
+    ]),
+]
+
+
+def _applied_versions(cur):
+    cur.execute("SELECT 1 FROM information_schema.tables WHERE table_name = 'schema_migrations'")
+    if cur.fetchone() is None:
+        return set()
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def pending_migrations(conn):
+    cur = conn.cursor()
+    try:
+        applied = _applied_versions(cur)
+        conn.commit()
+    finally:
+        cur.close()
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+# 执行尚未执行的迁移，每个迁移在一个事务中完成并记录到 schema_migrations。
+# 已是最新版本时只读取 schema_migrations，不加锁、不执行 DDL。返回本次执行的版本号列表。
+def migrate(conn):
+    if not pending_migrations(conn):
+        return []
+    cur = conn.cursor()
+    applied_now = []
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        # 拿到锁后重新读取，其他进程可能已经完成了迁移
+        applied = _applied_versions(cur)
+        for version, name, steps in MIGRATIONS:
+            if version in applied:
+                continue
+            try:
+                for step in steps:
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                log.exception('数据库迁移 %s（%s）失败', version, name)
+                raise
+            log.info('已执行数据库迁移 %s：%s', version, name)
+            applied_now.append(version)
+    finally:
+        try:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+        finally:
+            cur.close()
+    return applied_now
+
+
+if __name__ == '__main__':
+    from db_pool import ConnectionPool, DB_CONFIG
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    pool = ConnectionPool(DB_CONFIG, min_size=0, max_size=1)
+    with pool.connection() as conn:
+        versions = migrate(conn)
+    pool.close()
+    print(f'已执行迁移: {versions}' if versions else '数据库已是最新版本')
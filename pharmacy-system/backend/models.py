@@ -9,9 +9,10 @@ class User(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'admin' 或 'staff'
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    disabled_at = db.Column(db.DateTime)  # 不为空表示已停用（见 migrations.py 迁移 12）
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -24,12 +25,18 @@ class Medicine(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    specification = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.String(100), nullable=False)
     manufacturer = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Numeric(10, 2), nullable=False)
     stock = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # 与 migrations.py 中的约束一致
+    __table_args__ = (
+        db.CheckConstraint('stock >= 0', name='ck_medicines_stock_nonnegative'),
+        db.CheckConstraint('price >= 0', name='ck_medicines_price_nonnegative'),
+    )
 
 class SalesRecord(db.Model):
     __tablename__ = 'sales_records'
@@ -39,7 +46,43 @@ class SalesRecord(db.Model):
     salesperson_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     total_price = db.Column(db.Numeric(10, 2), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 按 created_at 按月分区（见 migrations.py 迁移 9），数据库中的主键为 (id, created_at)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.CheckConstraint('quantity > 0', name='ck_sales_quantity_positive'),
+        db.CheckConstraint('total_price >= 0', name='ck_sales_total_price_nonnegative'),
+    )
     
     medicine = db.relationship('Medicine', backref=db.backref('sales_records', lazy=True))
-    salesperson = db.relationship('User', backref=db.backref('sales_records', lazy=True), foreign_keys=[salesperson_id]) 
\ No newline at end of file
+    salesperson = db.relationship('User', backref=db.backref('sales_records', lazy=True), foreign_keys=[salesperson_id]) 
+
+class MedicineLot(db.Model):
+    __tablename__ = 'medicine_lots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id', ondelete='CASCADE'), nullable=False)
+    lot_number = db.Column(db.String(50), nullable=False)
+    expiry_date = db.Column(db.Date)  # 为空表示未分批库存（见 lots.py）
+    quantity = db.Column(db.Integer, nullable=False)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # 与 migrations.py 迁移 10 一致
+    __table_args__ = (
+        db.UniqueConstraint('medicine_id', 'lot_number', name='uq_medicine_lots_number'),
+        db.CheckConstraint('quantity >= 0', name='ck_medicine_lots_quantity_nonnegative'),
+    )
+    
+    medicine = db.relationship('Medicine', backref=db.backref('lots', lazy=True))
+
+class SaleLotAllocation(db.Model):
+    __tablename__ = 'sale_lot_allocations'
+    
+    # 销售记录表按月分区，主键为 (id, created_at)，sale_id 不建外键
+    sale_id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('medicine_lots.id', ondelete='CASCADE'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.CheckConstraint('quantity > 0', name='ck_sale_lot_allocations_quantity_positive'),
+    )
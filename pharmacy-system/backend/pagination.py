@@ -0,0 +1,87 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+
+class InvalidParameter(ValueError):
+    pass
+
+
+# 游标是 (created_at, id) 的不透明编码，客户端原样带回即可
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidParameter('无效的分页游标')
+
+
+def parse_limit(value, default, maximum):
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidParameter('limit 必须是整数')
+    if limit < 1:
+        raise InvalidParameter('limit 必须大于 0')
+    return min(limit, maximum)
+
+
+def query_int(args, name):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidParameter(f'{name} 必须是整数')
+
+
+def query_decimal(args, name):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise InvalidParameter(f'{name} 必须是数字')
+
+
+# 日期参数支持 YYYY-MM-DD 或 ISO 时间；end=True 时返回不含的上界，
+# 只给日期时包含当天全天
+def query_datetime(args, name, end=False):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        if len(value) == 10:
+            parsed = datetime.strptime(value, '%Y-%m-%d')
+            return parsed + timedelta(days=1) if end else parsed
+        parsed = datetime.fromisoformat(value)
+        return parsed + timedelta(microseconds=1) if end else parsed
+    except ValueError:
+        raise InvalidParameter(f'{name} 日期格式错误')
+
+
+def query_fields(args, allowed, default):
+    value = args.get('fields')
+    if not value:
+        return list(default)
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise InvalidParameter(f'未知字段: {", ".join(unknown)}')
+    return fields
+
+
+# LIKE 前缀匹配，转义通配符
+def like_prefix(prefix):
+    return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
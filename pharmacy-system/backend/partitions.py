@@ -0,0 +1,281 @@
+import csv
+import gzip
+import logging
+import os
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+
+log = logging.getLogger('pharmacy.partitions')
+
+# pg_advisory_xact_lock 的锁号，多个进程同时检查时只有一个创建分区
+PARTITION_LOCK_ID = 7270014
+
+PARTITION_PREFIX = 'sales_records_'
+DEFAULT_PARTITION = 'sales_records_default'
+ARCHIVE_COLUMNS = ('id', 'medicine_id', 'salesperson_id', 'quantity', 'total_price', 'created_at')
+# 归档时分离分区需要短暂锁住 sales_records，等不到锁就放弃本次归档，不阻塞收银
+DETACH_LOCK_TIMEOUT = '5s'
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    year, index = divmod(month.year * 12 + month.month - 1 + months, 12)
+    return date(year, index + 1, 1)
+
+
+# 按月分区的表名，如 sales_records_202401
+def partition_name(month):
+    return f'{PARTITION_PREFIX}{month:%Y%m}'
+
+
+def parse_month(value):
+    try:
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        raise ValueError('月份格式应为 YYYY-MM')
+
+
+# openGauss 等不支持声明式分区的数据库上迁移 9 不转换表结构，分区维护和归档都不可用
+def is_partitioned(cur):
+    cur.execute("""
+        SELECT 1 FROM pg_class
+        WHERE relname = 'sales_records' AND relkind = 'p' AND pg_table_is_visible(oid)
+    """)
+    return cur.fetchone() is not None
+
+
+# 现有的按月分区（不含默认分区），按月份排序
+def monthly_partitions(cur):
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'sales_records'::regclass
+    """)
+    months = []
+    for (name,) in cur.fetchall():
+        suffix = name[len(PARTITION_PREFIX):]
+        if len(suffix) == 6 and suffix.isdigit():
+            months.append(date(int(suffix[:4]), int(suffix[4:]), 1))
+    return sorted(months)
+
+
+# 先建普通表，再把默认分区中属于该月的记录移入，最后 ATTACH。
+# ATTACH 对 sales_records 只加 SHARE UPDATE EXCLUSIVE 锁（CREATE TABLE ... PARTITION OF 需要
+# ACCESS EXCLUSIVE 锁），但要对默认分区加 ACCESS EXCLUSIVE 锁并扫描它，移入记录的 DELETE 也锁定
+# 默认分区中的行：到事务提交前，读写默认分区的销售查询（不按日期裁剪分区的列表、落入默认分区的销售）
+# 会等待。分区提前 months_ahead 个月建立，正常情况下默认分区为空，等待很短
+def create_partition(cur, month):
+    name = partition_name(month)
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    cur.execute(f"CREATE TABLE {name} (LIKE sales_records INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE created_at >= %s AND created_at < %s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, (lower, upper))
+    cur.execute(f"ALTER TABLE sales_records ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+
+
+# 补齐从 first_month（默认为本月）到 months_ahead 个月之后的分区，返回新建分区的月份。
+# 调用方负责提交事务；超出已有分区范围的记录落入默认分区，建分区时会移到对应的分区中
+def ensure_partitions(cur, months_ahead, first_month=None):
+    if not is_partitioned(cur):
+        return []
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_ID,))
+    existing = set(monthly_partitions(cur))
+    current = month_start(date.today())
+    month = min(month_start(first_month), current) if first_month else current
+    created = []
+    while month <= add_months(current, months_ahead):
+        if month not in existing:
+            create_partition(cur, month)
+            created.append(month)
+        month = add_months(month, 1)
+    return created
+
+
+def _parse_archive_row(row):
+    return (int(row[0]), int(row[1]) if row[1] else None, int(row[2]) if row[2] else None,
+            int(row[3]), Decimal(row[4]), row[5])
+
+
+# 逐行读取归档文件：(id, 药品ID, 销售人员ID, 数量, 金额, 销售时间字符串)
+def read_archive(path):
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            yield _parse_archive_row(row)
+
+
+# 归档一个月的分区：导出为 gzip 压缩的 CSV，核对条数和合计后分离并删除分区，
+# 在 sales_archive 中登记。按天汇总表不受影响，营业额等统计接口照常包含已归档的月份。
+# 导出期间对该分区加 SHARE 锁，只阻塞对这个月份销售记录的修改
+def archive_partition(conn, month, directory):
+    name = partition_name(month)
+    filename = f'{name}.csv.gz'
+    path = os.path.join(directory, filename)
+    temp_path = path + '.tmp'
+    os.makedirs(directory, exist_ok=True)
+    cur = conn.cursor()
+    try:
+        cur.execute(f"LOCK TABLE {name} IN SHARE MODE")
+        cur.execute(f"SELECT COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(total_price), 0) FROM {name}")
+        expected = cur.fetchone()
+        with gzip.open(temp_path, 'wt', encoding='utf-8', newline='') as f:
+            cur.copy_expert(f"""
+                COPY (SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {name} ORDER BY created_at, id)
+                TO STDOUT WITH (FORMAT csv, HEADER)
+            """, f)
+        written = [0, 0, Decimal(0)]
+        for row in read_archive(temp_path):
+            written[0] += 1
+            written[1] += row[3]
+            written[2] += row[4]
+        if tuple(written) != (expected[0], expected[1], expected[2]):
+            raise ArchiveError(f'{name} 导出结果与数据库不一致：{tuple(written)} != {tuple(expected)}')
+        with open(temp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        # 已归档的销售不能再删除，扣减批次的记录不再需要
+        cur.execute(f"DELETE FROM sale_lot_allocations a USING {name} s WHERE a.sale_id = s.id")
+        cur.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+        cur.execute(f"ALTER TABLE sales_records DETACH PARTITION {name}")
+        cur.execute(f"DROP TABLE {name}")
+        cur.execute("""
+            INSERT INTO sales_archive (month, filename, sale_count, quantity, revenue)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (month) DO UPDATE
+            SET filename = EXCLUDED.filename, sale_count = EXCLUDED.sale_count,
+                quantity = EXCLUDED.quantity, revenue = EXCLUDED.revenue, archived_at = now()
+        """, (month, filename, *expected))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        cur.close()
+    log.info('已归档 %s：%s 条销售记录 -> %s', name, expected[0], path)
+    return {'month': month.strftime('%Y-%m'), 'filename': filename, 'sale_count': expected[0]}
+
+
+# 归档 before 月份（不含）之前的所有按月分区，每个分区单独一个事务
+def archive_partitions(conn, directory, before):
+    cur = conn.cursor()
+    try:
+        if not is_partitioned(cur):
+            raise ArchiveError('sales_records 不是分区表，无法归档')
+        months = [m for m in monthly_partitions(cur) if m < before]
+        conn.commit()
+    finally:
+        cur.close()
+    return [archive_partition(conn, month, directory) for month in months]
+
+
+# 归档文件内容不变，汇总结果按文件路径、修改时间和筛选条件缓存
+@lru_cache(maxsize=64)
+def _summarize(path, mtime, medicine_id, salesperson_id):
+    total = [0, 0, Decimal(0)]
+    days = {}
+    medicines = {}
+    for _, row_medicine, row_salesperson, quantity, total_price, created_at in read_archive(path):
+        if medicine_id is not None and row_medicine != medicine_id:
+            continue
+        if salesperson_id is not None and row_salesperson != salesperson_id:
+            continue
+        for entry in (total, days.setdefault(created_at[:10], [0, 0, Decimal(0)]),
+                      medicines.setdefault(row_medicine, [0, 0, Decimal(0)])):
+            entry[0] += 1
+            entry[1] += quantity
+            entry[2] += total_price
+    return total, days, medicines
+
+
+# 统计归档文件中的销售：合计、按天汇总和按金额排序的药品
+def summarize_archive(path, medicine_id=None, salesperson_id=None):
+    started = time.perf_counter()
+    total, days, medicines = _summarize(path, os.path.getmtime(path), medicine_id, salesperson_id)
+    ranked = sorted(medicines.items(), key=lambda item: item[1][2], reverse=True)
+    return {
+        'sale_count': total[0],
+        'quantity': total[1],
+        'revenue': float(total[2]),
+        'days': [{'day': day, 'sale_count': v[0], 'quantity': v[1], 'revenue': float(v[2])}
+                 for day, v in sorted(days.items())],
+        'medicines': [(medicine_id, v[0], v[1], float(v[2])) for medicine_id, v in ranked],
+        'seconds': round(time.perf_counter() - started, 4)
+    }
+
+
+# 后台维护分区：每 check_interval 秒补齐未来 months_ahead 个月的分区，
+# 销售写入时不需要检查分区是否存在（找不到分区的记录落入默认分区）
+class PartitionMaintainer:
+    def __init__(self, months_ahead=3, check_interval=3600.0, start_delay=0.0):
+        self.months_ahead = months_ahead
+        self.check_interval = check_interval
+        self.start_delay = start_delay
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._stats = {'checks': 0, 'check_errors': 0, 'created': 0, 'partitioned': 0}
+
+    # 每个进程启动一次，检查在后台线程中进行。按进程号判断：fork 之前启动的线程不会带到子进程中
+    def ensure_started(self, pool):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pool = pool
+        threading.Thread(target=self._run, name='partition-maintainer', daemon=True).start()
+
+    def _run(self):
+        time.sleep(self.start_delay)
+        while True:
+            try:
+                self.check()
+            except Exception:
+                with self._lock:
+                    self._stats['check_errors'] += 1
+                log.exception('创建销售记录分区失败')
+            time.sleep(self.check_interval)
+
+    def check(self):
+        with self._pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                partitioned = is_partitioned(cur)
+                created = ensure_partitions(cur, self.months_ahead) if partitioned else []
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.close()
+        for month in created:
+            log.info('已创建销售记录分区 %s', partition_name(month))
+        with self._lock:
+            self._stats['checks'] += 1
+            self._stats['created'] += len(created)
+            self._stats['partitioned'] = 1 if partitioned else 0
+        return created
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
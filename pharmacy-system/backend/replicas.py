@@ -0,0 +1,255 @@
+import itertools
+import logging
+import threading
+import time
+
+import psycopg2
+
+from db_pool import ConnectionPool, PoolTimeout
+
+log = logging.getLogger('pharmacy.replicas')
+
+REPLICA_CONNECT_TIMEOUT = 2
+
+
+# PostgreSQL 的 WAL 位置（如 0/1A2B3C4）转为整数以便比较
+def parse_lsn(value):
+    if not value:
+        return None
+    high, _, low = value.partition('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+# DB_REPLICAS 的格式：逗号分隔的 host:port，库名、用户名和密码与主库相同
+def parse_replicas(value, base_config):
+    replicas = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(':')
+        if not host:
+            host, port = port, base_config['port']
+        replicas.append(dict(base_config, host=host, port=port))
+    return replicas
+
+
+class Replica:
+    def __init__(self, config, pool_options):
+        self.name = f"{config['host']}:{config['port']}"
+        self.config = config
+        # 副本所在主机不可达时尽快失败，改用主库
+        self.pool = ConnectionPool(dict(config, connect_timeout=REPLICA_CONNECT_TIMEOUT), **pool_options)
+        self.healthy = False
+        self.replay_lsn = None      # 已回放到的 WAL 位置；不是流复制的备库时为 None
+        self.lag = None
+        self.error = None
+        self.routed = 0
+        self._check_conn = None
+
+    def status(self):
+        return {'name': self.name, 'healthy': self.healthy, 'lag_seconds': self.lag,
+                'routed': self.routed, 'error': self.error}
+
+
+# 读写分离：只读请求轮询分配到健康的只读副本
+# 后台线程每 check_interval 秒用单独的连接检查各副本（不占用连接池）：连接失败或复制延迟
+# 超过 max_lag 秒的副本暂停使用，恢复后自动重新加入。已回放到主库当前 WAL 位置的副本延迟为 0，
+# 否则延迟为距最后回放的事务提交的时间。请求借用副本连接失败时也立即暂停该副本，
+# 改用主库。没有健康的副本时只读请求也使用主库。
+# 读自己的写：写操作提交后记录主库的 WAL 位置，该用户随后的只读请求只分配给已回放到该位置的副本，
+# 没有这样的副本时使用主库。健康副本的延迟不超过 max_lag，因此记录保留 max_lag + check_interval 秒
+class ReplicaRouter:
+    def __init__(self, primary, replicas, pool_options=None, check_interval=1.0, max_lag=10.0):
+        self.primary = primary
+        self._primary_conn = None
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.sticky_seconds = max_lag + check_interval
+        self.replicas = [Replica(config, pool_options or {}) for config in replicas]
+        self._rotation = itertools.count()
+        self._lock = threading.Lock()
+        self._started = False
+        self._writes = {}           # 用户 -> (WAL 位置, 过期时间)
+        self._stats = {'replica_reads': 0, 'primary_reads': 0, 'sticky_reads': 0, 'failovers': 0,
+                       'replica_busy': 0, 'checks': 0, 'check_errors': 0}
+
+    @property
+    def enabled(self):
+        return bool(self.replicas)
+
+    def ensure_started(self):
+        with self._lock:
+            if self._started or not self.replicas:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name='replica-health-check', daemon=True).start()
+
+    # 写操作提交后调用，lsn 为提交后主库的 pg_current_wal_lsn()
+    def record_write(self, key, lsn):
+        lsn = parse_lsn(lsn)
+        if lsn is None or key is None:
+            return
+        with self._lock:
+            current = self._writes.get(key)
+            if current is None or current[0] < lsn:
+                self._writes[key] = (lsn, time.monotonic() + self.sticky_seconds)
+
+    # 该用户最近一次写操作的 WAL 位置，副本已经全部追上或记录过期时返回 None
+    def pending_write(self, key):
+        with self._lock:
+            entry = self._writes.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._writes[key]
+                return None
+            return entry[0]
+
+    # 可以使用的副本，按轮询顺序排列：健康且已回放到 min_lsn（需要读到的写操作位置，见 pending_write）。
+    # 依次尝试借用连接，借到时调用 record_routed，连接池已满时调用 record_busy，连接失败时调用
+    # mark_failed；都借不到时调用 record_primary_read 并改用主库。异步模式（asgi.py）的副本连接池也按此选择
+    def candidates(self, min_lsn=None):
+        self.ensure_started()
+        with self._lock:
+            candidates = [r for r in self.replicas if r.healthy and
+                          (min_lsn is None or (r.replay_lsn is not None and r.replay_lsn >= min_lsn))]
+            if not candidates:
+                self._stats['sticky_reads' if min_lsn is not None else 'primary_reads'] += 1
+                return []
+            start = next(self._rotation) % len(candidates)
+        return candidates[start:] + candidates[:start]
+
+    def record_routed(self, replica):
+        with self._lock:
+            replica.routed += 1
+            self._stats['replica_reads'] += 1
+
+    def record_busy(self):
+        with self._lock:
+            self._stats['replica_busy'] += 1
+
+    def record_primary_read(self):
+        with self._lock:
+            self._stats['primary_reads'] += 1
+
+    # 借用只读连接，返回 (副本连接池, 连接)；应使用主库时返回 (None, None)
+    def getconn(self, min_lsn=None):
+        candidates = self.candidates(min_lsn)
+        if not candidates:
+            return None, None
+        for replica in candidates:
+            try:
+                conn = replica.pool.getconn()
+            except PoolTimeout:
+                self.record_busy()
+                continue
+            except psycopg2.Error as e:
+                self.mark_failed(replica, e)
+                continue
+            self.record_routed(replica)
+            return replica.pool, conn
+        self.record_primary_read()
+        return None, None
+
+    def mark_failed(self, replica, error):
+        with self._lock:
+            was_healthy = replica.healthy
+            replica.healthy = False
+            replica.error = str(error).strip()
+            if was_healthy:
+                self._stats['failovers'] += 1
+        replica.pool.discard_idle()
+        if was_healthy:
+            log.warning('只读副本 %s 不可用，改用其他副本或主库：%s', replica.name, replica.error)
+
+    def _connect(self, config):
+        conn = psycopg2.connect(connect_timeout=max(1, int(self.check_interval * 2)), **config)
+        conn.autocommit = True
+        return conn
+
+    # 主库当前的 WAL 位置，读取失败时返回 None（只按回放时间判断延迟）
+    def _primary_lsn(self):
+        try:
+            if self._primary_conn is None or self._primary_conn.closed:
+                self._primary_conn = self._connect(self.primary)
+            cur = self._primary_conn.cursor()
+            cur.execute("SELECT pg_current_wal_lsn()::text")
+            lsn = cur.fetchone()[0]
+            cur.close()
+            return parse_lsn(lsn)
+        except psycopg2.Error:
+            log.exception('读取主库 WAL 位置失败')
+            if self._primary_conn is not None:
+                self._primary_conn.close()
+                self._primary_conn = None
+            return None
+
+    def _run(self):
+        while True:
+            primary_lsn = self._primary_lsn()
+            for replica in self.replicas:
+                self._check(replica, primary_lsn)
+            with self._lock:
+                self._stats['checks'] += 1
+                now = time.monotonic()
+                for key in [k for k, v in self._writes.items() if v[1] < now]:
+                    del self._writes[key]
+            time.sleep(self.check_interval)
+
+    # 不是流复制备库（pg_is_in_recovery() 为假）的副本没有延迟，但无法判断是否包含某次写操作
+    def _check(self, replica, primary_lsn):
+        try:
+            if replica._check_conn is None or replica._check_conn.closed:
+                replica._check_conn = self._connect(replica.config)
+            cur = replica._check_conn.cursor()
+            cur.execute("""
+                SELECT pg_is_in_recovery(),
+                       CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn()::text END,
+                       EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+            """)
+            in_recovery, lsn, replay_age = cur.fetchone()
+            cur.close()
+        except psycopg2.Error as e:
+            with self._lock:
+                self._stats['check_errors'] += 1
+            if replica._check_conn is not None:
+                replica._check_conn.close()
+                replica._check_conn = None
+            self.mark_failed(replica, e)
+            return
+        lsn = parse_lsn(lsn)
+        if not in_recovery or (lsn is not None and primary_lsn is not None and lsn >= primary_lsn):
+            lag = 0.0
+        else:
+            lag = float(replay_age) if replay_age is not None else float('inf')
+        healthy = lag <= self.max_lag
+        with self._lock:
+            recovered = healthy and not replica.healthy
+            replica.replay_lsn = lsn
+            replica.lag = round(lag, 3) if lag != float('inf') else None
+            if not healthy:
+                replica.error = f'复制延迟 {lag:.1f} 秒'
+            elif recovered:
+                replica.error = None
+            was_healthy = replica.healthy
+            replica.healthy = healthy
+            if was_healthy and not healthy:
+                self._stats['failovers'] += 1
+        if recovered:
+            log.info('只读副本 %s 已恢复使用', replica.name)
+        elif was_healthy and not healthy:
+            log.warning('只读副本 %s 复制延迟 %.1f 秒，暂停使用', replica.name, lag)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['replicas'] = len(self.replicas)
+            stats['healthy'] = sum(1 for r in self.replicas if r.healthy)
+            stats['sticky_users'] = len(self._writes)
+            stats['replica_status'] = [r.status() for r in self.replicas]
+        return stats
+
+    def close(self):
+        for replica in self.replicas:
+            replica.pool.close()
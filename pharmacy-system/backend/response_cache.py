@@ -0,0 +1,77 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+# 递增 sequences 中的版本号序列的语句，with_lsn 时最后一列是主库当前的 WAL 位置（配置了只读副本时使用）
+def bump_sql(sequences, with_lsn=False):
+    columns = [f"nextval('{sequence}')" for sequence in sequences]
+    if with_lsn:
+        columns.append("pg_current_wal_lsn()::text")
+    return f"SELECT {', '.join(columns)}"
+
+
+# 按版本号失效的列表响应缓存（药品目录、用户列表各一个实例）
+# 缓存内容是序列化好的 JSON 响应体和 ETag，按查询参数区分。
+# 版本号保存在数据库序列中（catalogue_version_seq、user_directory_version_seq），对应数据的
+# 写操作提交后递增，多个 gunicorn worker 通过比对版本号判断缓存是否失效。版本号最多每
+# check_interval 秒读取一次，期间的重复请求完全不访问数据库。
+class VersionedResponseCache:
+    def __init__(self, check_interval=1.0, maxsize=64):
+        self.check_interval = check_interval
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._entries = OrderedDict()   # key -> (etag, body, headers)
+        self._stats = {'hits': 0, 'misses': 0, 'version_checks': 0, 'invalidations': 0}
+
+    def version(self, read_version):
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return self._version
+        version = read_version()
+        with self._lock:
+            self._stats['version_checks'] += 1
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._checked_at = now
+        return version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def put(self, key, version, body, headers=None):
+        etag = f'{version}-{hashlib.md5(body).hexdigest()[:16]}'
+        entry = (etag, body, headers or {})
+        with self._lock:
+            # 构建期间版本已变化的结果不缓存
+            if version == self._version:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._checked_at = 0.0
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['version'] = self._version
+            stats['entries'] = len(self._entries)
+        return stats
@@ -0,0 +1,66 @@
+import threading
+import time
+from collections import OrderedDict
+
+# get() 未命中时的返回值，与“用户已删除”（None）区分
+MISSING = object()
+
+
+# 进程内 用户ID -> 角色 缓存，带 TTL 和 LRU 淘汰
+# 已删除的用户记录为墓碑，在墓碑有效期内即使令牌中带有角色也拒绝访问，
+# 墓碑单独存放，不会被 LRU 淘汰
+class RoleCache:
+    def __init__(self, maxsize=1024, ttl=300.0, tombstone_ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.tombstone_ttl = tombstone_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # user_id -> (role, expires_at)
+        self._tombstones = {}           # user_id -> expires_at
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            expires_at = self._tombstones.get(user_id)
+            if expires_at is not None:
+                if expires_at > now:
+                    self._stats['hits'] += 1
+                    return None
+                del self._tombstones[user_id]
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[user_id]
+                self._stats['misses'] += 1
+                return MISSING
+            self._entries.move_to_end(user_id)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def set(self, user_id, role):
+        with self._lock:
+            self._tombstones.pop(user_id, None)
+            self._entries[user_id] = (role, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def revoke(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._tombstones = {k: v for k, v in self._tombstones.items() if v > now}
+            self._tombstones[user_id] = now + self.tombstone_ttl
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['tombstones'] = len(self._tombstones)
+        return stats
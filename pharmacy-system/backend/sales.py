@@ -0,0 +1,113 @@
+import os
+import random
+
+from metrics import CounterSet
+
+# 单笔销售（POST /api/sales）
+#
+# 同步模式（app.create_sale，psycopg2）和异步模式（asgi.create_sale，asyncpg）执行同一组语句，
+# 占位符为 psycopg2 的 %s，异步模式转换为 $1, $2 ...。一个事务中依次：
+#   1. 抢占幂等键（idempotency.CLAIM_SQL）
+#   2. STOCK_UPDATE_SQL 条件扣减库存：检查和扣减在同一条语句中完成，并发收银不会超卖；没有返回行即库存不足
+#   3. INSERT_SALE_SQL 写销售记录
+#   4. 按有效期从早到晚分配批次（lots.ALLOCATE_SQL）
+#   5. ROLLUP_SQL 增量更新按天汇总
+#   6. 发送 sale_created 变更事件（events.NOTIFY_SQL）
+#   7. 保存幂等响应（idempotency.SAVE_SQL）
+# 序列化失败或死锁时按 retry_delay 退避重试，最多 SALE_MAX_RETRIES 次。提交之后调用 after_commit，
+# 再递增目录版本号（response_cache.bump_sql）
+
+SALE_MAX_RETRIES = int(os.environ.get('SALE_MAX_RETRIES', 3))
+SALE_CONTENTION_THRESHOLD = float(os.environ.get('SALE_CONTENTION_THRESHOLD', 0.01))
+
+# 销售指标（两种模式共用）：
+#   attempts/committed/out_of_stock/failures  事务尝试、成功、库存不足、失败次数
+#   conflicts/retries                        序列化失败或死锁次数、重试次数
+#   contended                                扣减库存等待超过阈值（行锁竞争）的次数
+#   stock_update_seconds_total/max           扣减库存语句耗时（含行锁等待）
+sale_metrics = CounterSet(
+    'attempts', 'committed', 'out_of_stock', 'failures', 'conflicts', 'retries', 'contended'
+)
+
+# 参数见 stock_update_params，返回 (价格, 扣减后的库存, 药品名称)
+STOCK_UPDATE_SQL = """
+    UPDATE medicines
+    SET stock = stock - %s
+    WHERE id = %s AND stock >= %s
+    RETURNING price, stock, name
+"""
+INSERT_SALE_SQL = """
+    INSERT INTO sales_records (medicine_id, salesperson_id, quantity, total_price, created_at)
+    VALUES (%s, %s, %s, %s, %s)
+    RETURNING id
+"""
+# 参数为 (日期, 药品ID, 销售人员ID, 数量, 金额)，计一笔
+ROLLUP_SQL = """
+    INSERT INTO sales_daily_rollup AS r (day, medicine_id, salesperson_id, sale_count, quantity, revenue)
+    VALUES (%s, %s, %s, 1, %s, %s)
+    ON CONFLICT (day, medicine_id, salesperson_id) DO UPDATE
+    SET sale_count = r.sale_count + 1,
+        quantity = r.quantity + EXCLUDED.quantity,
+        revenue = r.revenue + EXCLUDED.revenue
+"""
+
+
+class InvalidSale(ValueError):
+    pass
+
+
+# 校验请求体，返回 (药品ID, 数量)
+def parse_sale(data):
+    try:
+        medicine_id = int(data['medicine_id'])
+        quantity = int(data['quantity'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidSale('请提供药品和数量')
+    if quantity <= 0:
+        raise InvalidSale('销售数量必须大于 0')
+    return medicine_id, quantity
+
+
+def stock_update_params(medicine_id, quantity):
+    return quantity, medicine_id, quantity
+
+
+# 记录扣减库存语句的耗时，超过阈值计为一次行锁竞争
+def observe_stock_update(elapsed):
+    sale_metrics.observe('stock_update', elapsed)
+    if elapsed > SALE_CONTENTION_THRESHOLD:
+        sale_metrics.inc('contended')
+
+
+# 第 attempt 次重试前等待的秒数：指数退避加随机抖动
+def retry_delay(attempt):
+    return random.uniform(0, 0.01 * 2 ** attempt)
+
+
+def sale_response(sale_id):
+    return {'message': '销售成功', 'id': sale_id}
+
+
+# 销售的变更事件：销售记录字段与 GET /api/sales 一致（销售人员为 ID），stock 为药品提交后的库存
+def sale_event(sale_id, medicine_id, medicine_name, quantity, total_price, created_at, salesperson_id, stock):
+    return {
+        'id': sale_id,
+        'medicine_id': medicine_id,
+        'medicine_name': medicine_name,
+        'quantity': quantity,
+        'total_price': float(total_price),
+        'created_at': created_at.isoformat(),
+        'salesperson_id': salesperson_id,
+        'stock': stock
+    }
+
+
+# 提交之后的进程内步骤，services 为 app.extensions['pharmacy']：幂等响应放入进程内缓存、
+# 目录缓存失效、库存变化交给库存预警后台线程（只入队，不访问数据库）
+def after_commit(services, idempotency_key, body, medicine_id, quantity, stock):
+    sale_metrics.inc('committed')
+    if idempotency_key:
+        services['idempotency'].remember(*idempotency_key, 200, body)
+    services['catalogue_cache'].invalidate()
+    services['inventory_monitor'].ensure_started(services['pool'])
+    services['inventory_monitor'].publish(medicine_id, quantity, stock)
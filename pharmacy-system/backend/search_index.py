@@ -0,0 +1,167 @@
+import heapq
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+# 各字段命中时的加分
+NAME_PREFIX_BONUS = 3.0
+NAME_CONTAINS_BONUS = 1.5
+MANUFACTURER_BONUS = 0.75
+DESCRIPTION_BONUS = 0.25
+# 模糊匹配至少要命中查询 n-gram 的比例
+MIN_OVERLAP = 0.5
+# 单次查询最多累计的倒排项数，从最少见的 n-gram 开始累计，常见 n-gram 区分度低，超出预算时跳过
+POSTING_BUDGET = 20000
+# 参与打分的候选数上限（按命中数取前若干个），名称前缀匹配的候选总是参与
+MAX_CANDIDATES = 500
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text or '').lower().strip()
+
+
+# 字符二元组，中文药名通常只有几个字，二元组比三元组召回更好
+def ngrams(text):
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+# 药品名称、生产厂家、规格描述的内存 n-gram 索引
+# 索引只包含文本字段，按 version 整体重建；重建在后台线程进行，
+# 期间查询继续使用旧索引
+class MedicineSearchIndex:
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._building = False
+        self._state = None
+        self._stats = {'builds': 0, 'build_seconds_last': 0.0, 'queries': 0}
+
+    def ensure(self, read_version, load_rows):
+        now = time.monotonic()
+        with self._lock:
+            if self._state is not None and (self._building or now - self._checked_at < self.check_interval):
+                return
+            self._checked_at = now
+        version = read_version()
+        with self._lock:
+            if version == self._version or self._building:
+                return
+            self._building = True
+            first_build = self._state is None
+        if first_build:
+            self._build(version, load_rows)
+        else:
+            threading.Thread(target=self._build, args=(version, load_rows), daemon=True).start()
+
+    def _build(self, version, load_rows):
+        started = time.monotonic()
+        try:
+            docs = []
+            postings = {}
+            for row_id, name, manufacturer, description in load_rows():
+                fields = (normalize(name), normalize(manufacturer), normalize(description))
+                index = len(docs)
+                docs.append((row_id, name, manufacturer, description) + fields)
+                grams = set()
+                for field in fields:
+                    grams |= ngrams(field)
+                for gram in grams:
+                    posting = postings.get(gram)
+                    if posting is None:
+                        posting = postings[gram] = array('I')
+                    posting.append(index)
+            names = sorted((doc[4], i) for i, doc in enumerate(docs))
+            with self._lock:
+                self._state = (docs, postings, names)
+                self._version = version
+                self._stats['builds'] += 1
+                self._stats['build_seconds_last'] = round(time.monotonic() - started, 4)
+        finally:
+            with self._lock:
+                self._building = False
+
+    def search(self, query, limit=10):
+        with self._lock:
+            state = self._state
+            self._stats['queries'] += 1
+        q = normalize(query)
+        if state is None or not q:
+            return []
+        docs, postings, names = state
+
+        # 候选：名称前缀匹配 + n-gram 命中数
+        prefixed = []
+        start = bisect_left(names, (q, -1))
+        for name, index in names[start:start + limit * 4]:
+            if not name.startswith(q):
+                break
+            prefixed.append(index)
+        candidates = Counter()
+        grams = ngrams(q)
+        found = sorted((postings[g] for g in grams if g in postings), key=len)
+        considered = len(grams)
+        total = 0
+        for i, posting in enumerate(found):
+            total += len(posting)
+            if i > 0 and total > POSTING_BUDGET:
+                considered -= len(found) - i
+                found = found[:i]
+                break
+        if len(found) == 1:
+            # 只有一个 n-gram 时命中数都相同，不必全部计数
+            candidates.update(found[0][:MAX_CANDIDATES])
+        else:
+            for posting in found:
+                candidates.update(posting)
+
+        ranked = dict(candidates.most_common(MAX_CANDIDATES)) if len(candidates) > MAX_CANDIDATES else candidates
+        for index in prefixed:
+            ranked.setdefault(index, candidates[index])
+
+        required = max(1, MIN_OVERLAP * considered)
+        scored = []
+        for index, hits in ranked.items():
+            _, _, _, _, name, manufacturer, description = docs[index]
+            score = 0.0
+            if name.startswith(q):
+                score += NAME_PREFIX_BONUS
+            elif q in name:
+                score += NAME_CONTAINS_BONUS
+            if q in manufacturer:
+                score += MANUFACTURER_BONUS
+            if q in description:
+                score += DESCRIPTION_BONUS
+            if score == 0.0 and hits < required:
+                continue
+            score += hits / considered
+            scored.append((score, -len(name), index))
+
+        return [
+            {
+                'id': docs[index][0],
+                'name': docs[index][1],
+                'manufacturer': docs[index][2],
+                'description': docs[index][3],
+                'score': round(score, 3)
+            }
+            for score, _, index in heapq.nlargest(limit, scored)
+        ]
+
+    def invalidate(self):
+        # 下次查询时重新检查版本号
+        with self._lock:
+            self._checked_at = 0.0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['version'] = self._version
+            stats['documents'] = len(self._state[0]) if self._state else 0
+        return stats
@@ -0,0 +1,132 @@
+import gzip
+import json
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _dumps_json(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=True,
+                      default=_default).encode('utf-8')
+
+
+def _dumps_orjson(obj):
+    # orjson 原生处理 datetime / date（输出与 isoformat() 相同），Decimal 经 _default 转为浮点数
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_SORT_KEYS)
+
+
+ENCODERS = {'json': _dumps_json}
+if orjson is not None:
+    ENCODERS['orjson'] = _dumps_orjson
+
+
+def _parse_accept_encoding(header):
+    accepted = {}
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+# 列表接口的响应编码
+# JSON 编码器可选 orjson（已安装时默认使用）或标准库 json，Decimal、datetime 由编码器直接处理，
+# 不再逐个字段转换。rows 是数据库返回的元组，可输出为逐行对象（默认），或按列的数组
+# （compact：{"字段": [值, ...], ...}，字段名只出现一次）。
+# 响应体不小于 compress_min_size 字节时按 Accept-Encoding 使用 br（需安装 brotli）或 gzip 压缩。
+class ResponseEncoder:
+    def __init__(self, encoder='auto', compress_min_size=1024, gzip_level=6, brotli_quality=4):
+        if encoder == 'auto':
+            encoder = 'orjson' if 'orjson' in ENCODERS else 'json'
+        if encoder not in ENCODERS:
+            raise ValueError(f'不支持的 JSON 编码器: {encoder}')
+        self.encoder = encoder
+        self._dumps = ENCODERS[encoder]
+        self.compress_min_size = compress_min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = (('br',) if brotli is not None else ()) + ('gzip',)
+        self._lock = threading.Lock()
+        self._stats = {'responses': 0, 'compressed': 0, 'bytes_raw': 0, 'bytes_sent': 0,
+                       'encode_seconds_total': 0.0, 'compress_seconds_total': 0.0}
+
+    def dumps(self, obj):
+        return self._dumps(obj)
+
+    def encode_rows(self, columns, rows, compact=False):
+        started = time.perf_counter()
+        if compact:
+            values = list(zip(*rows)) if rows else [()] * len(columns)
+            body = self._dumps(dict(zip(columns, values)))
+        else:
+            body = self._dumps([dict(zip(columns, row)) for row in rows])
+        with self._lock:
+            self._stats['encode_seconds_total'] += time.perf_counter() - started
+        return body
+
+    # 按 Accept-Encoding 选择压缩方式，q 值相同时优先 br；都不接受时返回 None
+    def negotiate(self, accept_encoding):
+        accepted = _parse_accept_encoding(accept_encoding)
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = accepted.get(encoding, accepted.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    # 返回 (响应体, 响应头)；响应头总是带 Vary: Accept-Encoding
+    def compress(self, body, encoding):
+        headers = {'Vary': 'Accept-Encoding'}
+        size = len(body)
+        if encoding and size >= self.compress_min_size:
+            started = time.perf_counter()
+            if encoding == 'br':
+                body = brotli.compress(body, quality=self.brotli_quality)
+            else:
+                # mtime 固定为 0，相同内容压缩结果相同，ETag 保持稳定
+                body = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+            headers['Content-Encoding'] = encoding
+            with self._lock:
+                self._stats['compressed'] += 1
+                self._stats['compress_seconds_total'] += time.perf_counter() - started
+        with self._lock:
+            self._stats['responses'] += 1
+            self._stats['bytes_raw'] += size
+            self._stats['bytes_sent'] += len(body)
+        return body, headers
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['brotli'] = 1 if brotli is not None else 0
+        stats['orjson'] = 1 if self.encoder == 'orjson' else 0
+        return stats
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 后端是平铺的模块（app.py、db_pool.py ...），测试按模块名直接导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
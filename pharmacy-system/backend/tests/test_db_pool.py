@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+from psycopg2 import extensions
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+        self.fail_rollback = False
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise RuntimeError('connection lost')
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(**kwargs):
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', connect)
+    return opened
+
+
+def test_rejects_bad_sizes():
+    with pytest.raises(ValueError):
+        ConnectionPool({}, min_size=2, max_size=1)
+    with pytest.raises(ValueError):
+        ConnectionPool({}, max_size=0)
+
+
+def test_reuses_returned_connection(connections):
+    pool = ConnectionPool({}, max_size=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(connections) == 1
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_times_out_when_exhausted(connections):
+    pool = ConnectionPool({}, max_size=1, timeout=0.05)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats['timeouts'] == 1
+    assert stats['in_use'] == 1
+
+
+def test_waiting_borrower_gets_returned_connection(connections):
+    pool = ConnectionPool({}, max_size=1, timeout=5)
+    conn = pool.getconn()
+    borrowed = []
+    waiter = threading.Thread(target=lambda: borrowed.append(pool.getconn()))
+    waiter.start()
+    while pool.stats()['waiting'] == 0:
+        time.sleep(0.001)
+    pool.putconn(conn)
+    waiter.join(5)
+    assert borrowed == [conn]
+    assert pool.stats()['waits'] == 1
+
+
+def test_rolls_back_open_transaction_on_return(connections):
+    pool = ConnectionPool({})
+    conn = pool.getconn()
+    conn.status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+
+def test_discards_connection_that_cannot_roll_back(connections):
+    pool = ConnectionPool({})
+    conn = pool.getconn()
+    conn.status = extensions.TRANSACTION_STATUS_INERROR
+    conn.fail_rollback = True
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.getconn() is not conn
+    assert pool.stats()['connections_closed'] == 1
+
+
+def test_discards_expired_connection(connections):
+    pool = ConnectionPool({}, max_lifetime=0)
+    conn = pool.getconn()
+    time.sleep(0.01)
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()['size'] == 0
+
+
+def test_connect_error_frees_the_slot(monkeypatch):
+    def connect(**kwargs):
+        raise OSError('connection refused')
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', connect)
+    pool = ConnectionPool({}, max_size=1, timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(OSError):
+            pool.getconn()
+    stats = pool.stats()
+    assert (stats['size'], stats['in_use'], stats['connect_errors']) == (0, 0, 2)
+
+
+def test_connection_context_returns_connection(connections):
+    pool = ConnectionPool({})
+    with pool.connection() as conn:
+        assert pool.stats()['in_use'] == 1
+    assert pool.stats()['in_use'] == 0
+    assert pool.stats()['idle'] == 1
+    assert not conn.closed
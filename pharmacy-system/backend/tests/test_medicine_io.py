@@ -0,0 +1,70 @@
+import io
+from decimal import Decimal
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from medicine_io import ImportFormatError, copy_buffer, read_rows, validate_row
+
+
+def row(**overrides):
+    raw = {'name': '阿莫西林胶囊', 'description': '0.25g*24粒', 'manufacturer': '华北制药',
+           'price': '12.5', 'stock': '100'}
+    raw.update(overrides)
+    return raw
+
+
+def test_validate_row_converts_values():
+    assert validate_row(row(name='  阿莫西林胶囊 ', price='12.345', stock='1e2')) == (
+        '阿莫西林胶囊', '0.25g*24粒', '华北制药', Decimal('12.34'), 100)
+
+
+def test_validate_row_accepts_numbers_from_xlsx():
+    assert validate_row(row(price=12.5, stock=3))[3:] == (Decimal('12.50'), 3)
+
+
+@pytest.mark.parametrize('column', ['name', 'description', 'manufacturer'])
+def test_validate_row_requires_text_columns(column):
+    with pytest.raises(ValueError, match=column):
+        validate_row(row(**{column: ' '}))
+    with pytest.raises(ValueError, match='100'):
+        validate_row(row(**{column: 'x' * 101}))
+
+
+@pytest.mark.parametrize('price', ['abc', '', None, '-1', '100000000', 'NaN', 'sNaN', 'Infinity'])
+def test_validate_row_rejects_bad_price(price):
+    with pytest.raises(ValueError, match='price'):
+        validate_row(row(price=price))
+
+
+@pytest.mark.parametrize('stock', ['abc', '', None, '-1', '1.5', '2147483648', 'NaN', 'sNaN', 'Infinity', '-Infinity'])
+def test_validate_row_rejects_bad_stock(stock):
+    # NaN、Infinity 必须作为该行的错误报告，不能抛出 decimal.InvalidOperation
+    with pytest.raises(ValueError, match='stock'):
+        validate_row(row(stock=stock))
+
+
+def upload(text, filename='medicines.csv'):
+    return FileStorage(stream=io.BytesIO(text.encode('utf-8-sig')), filename=filename)
+
+
+def test_read_rows_maps_chinese_headers_and_skips_blank_lines():
+    rows = list(read_rows(upload('药品名称,规格,生产厂家,单价,库存\n甲,乙,丙,1,2\n,,,,\n丁,戊,己,3,4\n')))
+    assert rows == [
+        (2, {'name': '甲', 'description': '乙', 'manufacturer': '丙', 'price': '1', 'stock': '2'}),
+        (4, {'name': '丁', 'description': '戊', 'manufacturer': '己', 'price': '3', 'stock': '4'}),
+    ]
+
+
+def test_read_rows_reports_missing_columns():
+    with pytest.raises(ImportFormatError, match='stock'):
+        list(read_rows(upload('name,description,manufacturer,price\n')))
+
+
+def test_read_rows_rejects_other_file_types():
+    with pytest.raises(ImportFormatError):
+        list(read_rows(upload('name\n', filename='medicines.txt')))
+
+
+def test_copy_buffer_quotes_csv():
+    assert copy_buffer([(2, 'a,b', 'c"d')]).read() == '2,"a,b","c""d"\r\n'
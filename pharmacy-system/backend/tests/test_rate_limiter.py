@@ -0,0 +1,65 @@
+import pytest
+
+import auth
+from auth import RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth.time, 'monotonic', clock)
+    return clock
+
+
+def test_allows_burst_then_limits(clock):
+    limiter = RateLimiter(rate=0.5, capacity=3)
+    assert [limiter.acquire('alice')[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.acquire('alice')
+    assert not allowed
+    assert retry_after == pytest.approx(2.0)
+    assert limiter.stats() == {'allowed': 3, 'limited': 1, 'keys': 1}
+
+
+def test_refills_over_time(clock):
+    limiter = RateLimiter(rate=1, capacity=2)
+    limiter.acquire('ip')
+    limiter.acquire('ip')
+    assert not limiter.acquire('ip')[0]
+    clock.now += 1
+    assert limiter.acquire('ip') == (True, 0.0)
+    clock.now += 100
+    # 令牌最多积累到 capacity
+    assert [limiter.acquire('ip')[0] for _ in range(3)] == [True, True, False]
+
+
+def test_keys_are_independent(clock):
+    limiter = RateLimiter(rate=1, capacity=1)
+    assert limiter.acquire('alice')[0]
+    assert not limiter.acquire('alice')[0]
+    assert limiter.acquire('bob')[0]
+
+
+def test_evicts_least_recently_used_key(clock):
+    limiter = RateLimiter(rate=1, capacity=1, maxsize=2)
+    limiter.acquire('a')
+    limiter.acquire('b')
+    limiter.acquire('a')
+    limiter.acquire('c')
+    assert limiter.stats()['keys'] == 2
+    # b 被淘汰，重新从满桶开始；c 仍在限流
+    assert limiter.acquire('b')[0]
+    assert not limiter.acquire('c')[0]
+
+
+def test_zero_rate_never_refills(clock):
+    limiter = RateLimiter(rate=0, capacity=1)
+    limiter.acquire('ip')
+    assert limiter.acquire('ip') == (False, float('inf'))
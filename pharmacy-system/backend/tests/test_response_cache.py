@@ -0,0 +1,87 @@
+from response_cache import VersionedResponseCache, bump_sql
+
+
+class Versions:
+    def __init__(self, version=1):
+        self.version = version
+        self.reads = 0
+
+    def __call__(self):
+        self.reads += 1
+        return self.version
+
+
+def test_reads_version_at_most_once_per_interval():
+    versions = Versions()
+    cache = VersionedResponseCache(check_interval=60)
+    assert [cache.version(versions) for _ in range(3)] == [1, 1, 1]
+    assert versions.reads == 1
+
+
+def test_invalidate_forces_version_check_and_clears_entries():
+    versions = Versions()
+    cache = VersionedResponseCache(check_interval=60)
+    cache.put('q', cache.version(versions), b'[]')
+    cache.invalidate()
+    assert cache.get('q') is None
+    cache.version(versions)
+    assert versions.reads == 2
+
+
+def test_new_version_clears_entries():
+    versions = Versions()
+    cache = VersionedResponseCache(check_interval=0)
+    cache.put('q', cache.version(versions), b'[1]')
+    assert cache.get('q') is not None
+    versions.version = 2
+    assert cache.version(versions) == 2
+    assert cache.get('q') is None
+
+
+def test_put_returns_entry_with_etag():
+    cache = VersionedResponseCache()
+    version = cache.version(Versions(7))
+    etag, body, headers = cache.put('q', version, b'[1]', {'X-Next-Cursor': 'c'})
+    assert etag.startswith('7-')
+    assert (body, headers) == (b'[1]', {'X-Next-Cursor': 'c'})
+    assert cache.get('q') == (etag, body, headers)
+    # 内容相同则 ETag 相同，内容不同则不同
+    assert cache.put('r', version, b'[1]')[0] == etag
+    assert cache.put('s', version, b'[2]')[0] != etag
+
+
+def test_does_not_store_result_built_for_another_version():
+    cache = VersionedResponseCache()
+    cache.version(Versions(3))
+    etag, _, _ = cache.put('q', 2, b'[]')
+    assert etag.startswith('2-')
+    assert cache.get('q') is None
+    cache.put('q', 4, b'[]')
+    assert cache.get('q') is None
+
+
+def test_evicts_least_recently_used_entry():
+    cache = VersionedResponseCache(maxsize=2)
+    version = cache.version(Versions())
+    cache.put('a', version, b'a')
+    cache.put('b', version, b'b')
+    cache.get('a')
+    cache.put('c', version, b'c')
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['entries'] == 2
+
+
+def test_stats_count_hits_and_misses():
+    cache = VersionedResponseCache()
+    version = cache.version(Versions())
+    cache.get('q')
+    cache.put('q', version, b'[]')
+    cache.get('q')
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['version'], stats['version_checks']) == (1, 1, 1, 1)
+
+
+def test_bump_sql():
+    assert bump_sql(['catalogue_version_seq']) == "SELECT nextval('catalogue_version_seq')"
+    assert bump_sql(['a', 'b'], with_lsn=True) == "SELECT nextval('a'), nextval('b'), pg_current_wal_lsn()::text"
@@ -0,0 +1,99 @@
+import time
+
+from search_index import MedicineSearchIndex, ngrams, normalize
+
+ROWS = [
+    (1, '阿莫西林胶囊', '华北制药', '0.25g*24粒'),
+    (2, '阿莫西林克拉维酸钾片', '石药集团', '0.375g*12片'),
+    (3, '布洛芬缓释胶囊', '中美史克', '0.3g*20粒'),
+    (4, '维生素C片', '华北制药', '0.1g*100片'),
+    (5, 'Aspirin', 'Bayer', '100mg'),
+]
+
+
+def build(rows=ROWS, version=1):
+    index = MedicineSearchIndex(check_interval=60)
+    index.ensure(lambda: version, lambda: rows)
+    return index
+
+
+def ids(results):
+    return [r['id'] for r in results]
+
+
+def test_normalize_and_ngrams():
+    assert normalize('  ＡＳＰＩＲＩＮ ') == 'aspirin'
+    assert normalize(None) == ''
+    assert ngrams('布洛芬') == {'布洛', '洛芬'}
+    assert ngrams('a') == {'a'}
+    assert ngrams('') == set()
+
+
+def test_first_build_is_synchronous():
+    index = build()
+    assert index.stats()['documents'] == len(ROWS)
+    assert index.stats()['version'] == 1
+
+
+def test_name_prefix_ranks_first():
+    results = build().search('阿莫西林')
+    assert ids(results) == [1, 2]
+    assert results[0]['name'] == '阿莫西林胶囊'
+    assert results[0]['score'] > 3
+
+
+def test_matches_manufacturer_and_description():
+    assert set(ids(build().search('华北制药'))) == {1, 4}
+    # 100片 与 100mg 有一半的 n-gram 相同，也算模糊匹配，排在后面
+    assert ids(build().search('100mg')) == [5, 4]
+
+
+def test_case_and_width_insensitive():
+    assert ids(build().search('ASPI')) == [5]
+
+
+def test_fuzzy_match_needs_enough_overlap():
+    # 缓释胶囊：与布洛芬缓释胶囊命中全部 n-gram，与阿莫西林胶囊只命中“胶囊”
+    assert ids(build().search('缓释胶囊'))[0] == 3
+    assert build().search('头孢') == []
+
+
+def test_limit_and_empty_query():
+    index = build()
+    assert len(index.search('阿', limit=1)) == 1
+    # 单个字只按名称前缀匹配
+    assert index.search('片') == []
+    assert index.search('') == []
+    assert MedicineSearchIndex().search('阿莫西林') == []
+
+
+def test_rebuilds_in_background_when_version_changes():
+    version = [1]
+    rows = list(ROWS)
+    index = MedicineSearchIndex(check_interval=0)
+    index.ensure(lambda: version[0], lambda: rows)
+    rows.append((6, '头孢克肟分散片', '白云山', '0.1g*6片'))
+    index.ensure(lambda: version[0], lambda: rows)
+    assert index.stats()['builds'] == 1
+    version[0] = 2
+    index.ensure(lambda: version[0], lambda: rows)
+    deadline = time.monotonic() + 5
+    while index.stats()['version'] != 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ids(index.search('头孢')) == [6]
+
+
+def test_checks_version_once_per_interval_until_invalidated():
+    reads = []
+    index = MedicineSearchIndex(check_interval=60)
+
+    def read_version():
+        reads.append(1)
+        return 1
+
+    index.ensure(read_version, lambda: ROWS)
+    index.ensure(read_version, lambda: ROWS)
+    assert len(reads) == 1
+    index.invalidate()
+    index.ensure(read_version, lambda: ROWS)
+    assert len(reads) == 2
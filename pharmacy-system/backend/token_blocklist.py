@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger('pharmacy.token_blocklist')
+
+
+# 已吊销令牌的进程内名单
+# 吊销记录保存在 token_blocklist 表中：单个令牌按 jti 记录，吊销某个用户的全部令牌时
+# 记录 user_id 和吊销时间，签发时间不晚于该时间的令牌都视为已吊销。iat 只精确到秒，
+# 签发时间优先取令牌中的 issued_at（小数秒，见 app.py），吊销后同一秒内重新登录签发的令牌不受影响。
+# 校验令牌只查内存；后台线程每 sync_interval 秒按自增 ID 增量读取其他进程写入的记录
+# （并发事务可能晚于更大的 ID 提交，最近一分钟的记录每次都重新读取），并清理已过期的记录。
+# 由进程的启动钩子调用 ensure_started，同步加载一次之后才启动后台线程，请求中不访问数据库。
+class TokenBlocklist:
+    def __init__(self, sync_interval=5.0):
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._jtis = {}         # jti -> 过期时间（epoch 秒）
+        self._users = {}        # user_id -> (吊销时间, 过期时间)
+        self._last_id = 0
+        self._pool = None
+        self._pid = None
+        self._stats = {'syncs': 0, 'sync_errors': 0, 'revoked_checks': 0, 'purged': 0}
+
+    def is_revoked(self, claims):
+        with self._lock:
+            if claims.get('jti') in self._jtis:
+                self._stats['revoked_checks'] += 1
+                return True
+            entry = self._users.get(str(claims.get('sub')))
+            if entry is not None and claims.get('issued_at', claims.get('iat', 0)) <= entry[0]:
+                self._stats['revoked_checks'] += 1
+                return True
+        return False
+
+    # 吊销单个令牌，expires_at 为令牌的 exp
+    def revoke_token(self, conn, jti, user_id, expires_at):
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO token_blocklist (jti, user_id, expires_at)
+            VALUES (%s, %s, to_timestamp(%s))
+        """, (jti, user_id, expires_at))
+        cur.close()
+        with self._lock:
+            self._jtis[jti] = expires_at
+
+    # 吊销用户在此之前签发的全部令牌，ttl 取最长的令牌有效期（刷新令牌）
+    def revoke_user(self, conn, user_id, ttl):
+        self.revoke_users(conn, [user_id], ttl)
+
+    # 一条语句吊销多个用户的全部令牌
+    def revoke_users(self, conn, user_ids, ttl):
+        revoked_at = time.time()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO token_blocklist (user_id, revoked_at, expires_at)
+            SELECT unnest(%s::int[]), to_timestamp(%s), to_timestamp(%s)
+        """, (list(user_ids), revoked_at, revoked_at + ttl))
+        cur.close()
+        with self._lock:
+            for user_id in user_ids:
+                self._add_user(str(user_id), revoked_at, revoked_at + ttl)
+
+    def _add_user(self, user_id, revoked_at, expires_at):
+        current = self._users.get(user_id)
+        if current is None or current[0] < revoked_at:
+            self._users[user_id] = (revoked_at, expires_at)
+
+    # 每个进程启动一次，按进程号判断：fork 之前启动的线程不会带到子进程中
+    def ensure_started(self, pool):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pool = pool
+        try:
+            self.sync()
+        except Exception:
+            log.exception('加载令牌吊销名单失败')
+        threading.Thread(target=self._run, name='token-blocklist-sync', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except Exception:
+                with self._lock:
+                    self._stats['sync_errors'] += 1
+                log.exception('同步令牌吊销名单失败')
+
+    def sync(self):
+        with self._pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM token_blocklist WHERE expires_at < now()")
+            cur.execute("""
+                SELECT id, jti, user_id, EXTRACT(EPOCH FROM revoked_at), EXTRACT(EPOCH FROM expires_at)
+                FROM token_blocklist
+                WHERE id > %s OR revoked_at > now() - interval '1 minute'
+                ORDER BY id
+            """, (self._last_id,))
+            rows = cur.fetchall()
+            conn.commit()
+            cur.close()
+        now = time.time()
+        with self._lock:
+            for row_id, jti, user_id, revoked_at, expires_at in rows:
+                if jti is not None:
+                    self._jtis[jti] = float(expires_at)
+                else:
+                    self._add_user(str(user_id), float(revoked_at), float(expires_at))
+                self._last_id = max(self._last_id, row_id)
+            expired = [k for k, v in self._jtis.items() if v < now]
+            for jti in expired:
+                del self._jtis[jti]
+            expired_users = [k for k, v in self._users.items() if v[1] < now]
+            for user_id in expired_users:
+                del self._users[user_id]
+            self._stats['purged'] += len(expired) + len(expired_users)
+            self._stats['syncs'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['tokens'] = len(self._jtis)
+            stats['users'] = len(self._users)
+        return stats
@@ -10,6 +10,22 @@ import axios from 'axios'
 axios.defaults.baseURL = 'http://localhost:5000'
 axios.defaults.headers.common['Authorization'] = `Bearer ${localStorage.getItem('token')}`
 
+// 读写分离：写操作响应带 X-Write-LSN，之后的请求带上 X-Min-LSN，
+// 服务端只把读请求分配给已同步到该位置的只读副本，保证能读到自己刚提交的修改
+let minLsn = null
+axios.interceptors.response.use(response => {
+  if (response.headers['x-write-lsn']) {
+    minLsn = response.headers['x-write-lsn']
+  }
+  return response
+})
+axios.interceptors.request.use(config => {
+  if (minLsn) {
+    config.headers['X-Min-LSN'] = minLsn
+  }
+  return config
+})
+
 const app = createApp(App)
 
 app.use(ElementPlus)